@@ -0,0 +1,329 @@
+"""
+Parser benchmark suite for get_books and get_reviews.
+
+- runs over the fixture pages in --fixtures_dir (default fixtures/): book pages, top shelves and
+  lists pages, and reviews pages; pages saved from Goodreads (e.g. with "Save page as" or curl)
+  can be dropped in alongside the checked-in ones, --generate rewrites the checked-in set
+- reports pages/sec (and reviews/sec on reviews pages) and peak memory for every backend, and for
+  the old extraction that re-serialised the parse tree with str(soup) for each regex field
+- checks that every backend produces exactly the same output as bs4 (parity)
+- --save_baseline writes the results to bench_baseline.json; later runs compare against it and
+  flag every page and backend that got slower by more than --tolerance
+- exits with status 1 on any parity mismatch or regression
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import time
+from datetime import datetime
+
+import bs4
+
+import book_bs4
+import get_books
+import get_reviews
+
+
+BASELINE_FILE = 'bench_baseline.json'
+# extract_book canonicalises the book ID it is given, so the fixtures are scraped under a numeric one
+FIXTURE_BOOK_ID = '0.fixture'
+
+FORKSERVER = multiprocessing.get_context('forkserver')
+# ru_maxrss is in kilobytes, except on macOS
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def legacy_get_isbn(soup):
+    try:
+        return re.findall(r'nisbn: [0-9]{10}', str(soup))[0].split()[1]
+    except IndexError:
+        return "isbn not found"
+
+
+def legacy_get_isbn13(soup):
+    try:
+        return re.findall(r'nisbn13: [0-9]{13}', str(soup))[0].split()[1]
+    except IndexError:
+        return "isbn13 not found"
+
+
+def legacy_get_rating_distribution(soup):
+    distribution = re.findall(r'renderRatingGraph\([\s]*\[[0-9,\s]+', str(soup))[0]
+    distribution = ' '.join(distribution.split())
+    distribution = [int(c.strip()) for c in distribution.split('[')[1].split(',')]
+    return {'5 Stars': distribution[0],
+            '4 Stars': distribution[1],
+            '3 Stars': distribution[2],
+            '2 Stars': distribution[3],
+            '1 Star':  distribution[4]}
+
+
+def legacy_extract(source):
+    # the main page part of scrape_book before the single-pass extraction
+    soup = bs4.BeautifulSoup(source, 'html.parser')
+    return {'book_title': ' '.join(soup.find('h1', {'id': 'bookTitle'}).text.split()),
+            'book_series': book_bs4.get_series_name(soup),
+            'book_series_uri': book_bs4.get_series_uri(soup),
+            'top_5_other_editions': book_bs4.get_top_5_other_editions(soup),
+            'isbn': legacy_get_isbn(soup),
+            'isbn13': legacy_get_isbn13(soup),
+            'year_first_published': book_bs4.get_year_first_published(soup),
+            'authorlink': soup.find('a', {'class': 'authorName'})['href'],
+            'author': ' '.join(soup.find('span', {'itemprop': 'name'}).text.split()),
+            'num_pages': book_bs4.get_num_pages(soup),
+            'genres': book_bs4.get_genres(soup),
+            'num_ratings': soup.find('meta', {'itemprop': 'ratingCount'})['content'].strip(),
+            'num_reviews': soup.find('meta', {'itemprop': 'reviewCount'})['content'].strip(),
+            'average_rating': soup.find('span', {'itemprop': 'ratingValue'}).text.strip(),
+            'rating_distribution': legacy_get_rating_distribution(soup)}
+
+
+def extract_with(backend):
+    def extract(source):
+        return get_books.extract_book(source, backend.parse_book_page(source), FIXTURE_BOOK_ID, backend)
+    return extract
+
+
+def sub_page_with(backend):
+    def extract(source):
+        page = backend.parse_page(source)
+        return {'shelves': backend.get_shelf_texts(page),
+                'lists': backend.get_list_texts(page),
+                'next_page': backend.get_next_page_url(page),
+                'page_count': backend.get_page_count(page)}
+    return extract
+
+
+def parse_reviews_quietly(source):
+    # parse_reviews prints a count for every page
+    with contextlib.redirect_stdout(io.StringIO()):
+        return get_reviews.parse_reviews(source)
+
+
+def candidates(source):
+    """The page kind and the extractions benchmarked on it, by name, with the reference (bs4) first."""
+    if 'ReviewCard' in source:
+        return 'reviews', {'bs4': parse_reviews_quietly}
+    if 'id="bookTitle"' in source:
+        extractions = {name: extract_with(backend) for name, backend in get_books.BACKENDS.items()}
+        extractions['before'] = legacy_extract
+        return 'book', extractions
+    return 'sub_page', {name: sub_page_with(backend) for name, backend in get_books.BACKENDS.items()}
+
+
+def measure(func, source, repeat):
+    """Best CPU seconds per call over `repeat` runs."""
+    # each run makes enough calls to last ~0.1s, so small pages aren't lost in timer noise
+    start = time.process_time()
+    func(source)
+    calls = max(1, int(0.1 / max(time.process_time() - start, 1e-6)))
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(calls):
+            func(source)
+        seconds = (time.process_time() - start) / calls
+        best = seconds if best is None else min(best, seconds)
+
+    return best
+
+
+def _grow(source, name, conn):
+    func = candidates(source)[1][name]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func(source)
+    conn.send((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * MAXRSS_UNIT)
+    conn.close()
+
+
+def peak_memory(source, name):
+    """Bytes by which extraction `name` grows the peak resident memory of a fresh process on `source`.
+
+    The resident size counts what lxml allocates in C, which tracemalloc doesn't see. The child is
+    forked from a fork server that has only imported the modules: forked from this process, it would
+    reuse the memory freed by the timed runs, and started with exec, it would inherit this
+    process's ru_maxrss.
+    """
+    receiver, sender = FORKSERVER.Pipe(duplex=False)
+    child = FORKSERVER.Process(target=_grow, args=(source, name, sender))
+    child.start()
+    sender.close()
+    peak = receiver.recv()
+    child.join()
+    return peak
+
+
+def _book_page(title, editions, genres, friend_reviews):
+    # laid out like the book pages the extractors target, padded with the sections a popular book has
+    other_editions = ''.join(f'<div class="otherEdition"><a href="/book/show/{1000 + i}.Edition_{i}"><img src="/covers/{i}.jpg"/></a></div>\n'
+                             for i in range(editions))
+    genre_rows = ''.join(f'<div class="elementList"><div class="left">'
+                         f'<a class="actionLinkLite bookPageGenreLink" href="/genres/genre-{i}">Genre {i}</a> &gt; '
+                         f'<a class="actionLinkLite bookPageGenreLink" href="/genres/sub-genre-{i}">Sub Genre {i}</a></div>\n'
+                         f'<div class="right"><a class="actionLinkLite greyText" href="/shelf/users/{i}">{(genres - i) * 37:,} users</a></div></div>\n'
+                         for i in range(genres))
+    reviews = ''.join(f'<div class="friendReviews elementListBrown"><div class="section">'
+                      f'<a class="user" href="/user/show/{i}">Reader {i}</a> <span class="staticStars" title="liked it"></span>\n'
+                      f'<div class="reviewText stacked"><span class="readable">{"A long paragraph about the book. " * 20}</span></div></div></div>\n'
+                      for i in range(friend_reviews))
+    editions_data = json.dumps([{'id': 1000 + i, 'title': f'{title} ({i})', 'format': 'Paperback'} for i in range(editions * 50)])
+    return f'''<!DOCTYPE html>
+<html><head><title>{title}</title>
+<script>var editionsData = {editions_data};</script>
+</head><body>
+<div id="topcol">
+<h1 id="bookTitle" class="gr-h1 gr-h1--serif" itemprop="name">
+  {title}
+</h1>
+<h2 id="bookSeries"><a class="greyText" href="/series/40650-fixtures">(Fixtures #1)</a></h2>
+<div id="bookAuthors"><a class="authorName" itemprop="url" href="https://www.goodreads.com/author/show/1265.Jane_Austen"><span itemprop="name">Jane  Austen</span></a></div>
+<div id="bookMeta" itemprop="aggregateRating">
+<span itemprop="ratingValue">
+  4.28
+</span>
+<meta itemprop="ratingCount" content=" 3456789 " />
+<meta itemprop="reviewCount" content="  98765" />
+</div>
+<div id="details"><span itemprop="numberOfPages">279 pages</span>
+<div class="row">Published 2000 by Penguin <nobr class="greyText">(first published January 28th 1813)</nobr></div></div>
+<div class="otherEditionsSection">
+{other_editions}</div>
+{genre_rows}<a class="actionLink right bookPageGenreLink__seeMoreLink" href="/book/shelves/1885">See top shelves…</a>
+<a class="actionLink" href="/list/book/1885">More lists with this book...</a>
+{reviews}<script>
+  var bookDetails = "\\nisbn: 0679783261 \\nisbn13: 9780679783268";
+  renderRatingGraph([1940000, 1000000,
+     400000, 80000, 36789]);
+</script>
+</div></body></html>
+'''
+
+
+def _shelves_page(shelves):
+    stats = ''.join(f'<div class="shelfStat"><div><a class="mediumText actionLinkLite" href="/shelf/show/shelf-{i}">shelf-{i}</a></div>\n'
+                    f'<div class="smallText">{(shelves - i) * 1234:,} people</div></div>\n' for i in range(shelves))
+    return f'<html><body>\n<div class="leftContainer">\n{stats}</div>\n</body></html>\n'
+
+
+def _lists_page(lists, page, pages):
+    cells = ''.join(f'<div class="cell"><a class="listTitle" href="/list/show/{i}">List {page}-{i}</a>\n'
+                    f'<div class="listFullDetails">{i * 17:,} books — {i * 31:,} voters</div></div>\n' for i in range(lists))
+    links = ' '.join(f'<a href="/list/book/1885?page={n}">{n}</a>' if n != page else f'<em class="current">{n}</em>'
+                     for n in range(1, pages + 1))
+    if page < pages:
+        links += f' <a class="next_page" rel="next" href="/list/book/1885?page={page + 1}">next »</a>'
+    return f'<html><body>\n{cells}<div class="pagination">{links}</div>\n</body></html>\n'
+
+
+def _reviews_page(reviews):
+    cards = ''.join(f'''<article class="ReviewCard"><div class="ReviewCard__profile"><div class="ReviewerProfile__name"><a href="https://www.goodreads.com/user/show/{i}-reader">Reader {i}</a></div>
+<span class="Text Text__body3 Text__author">{'Author' if i % 50 == 0 else ''}</span></div>
+<section class="ReviewCard__content"><section class="ReviewCard__row"><div><span aria-label="Rating {i % 5 + 1} out of 5" role="img" class="RatingStars"></span></div>
+<section><span class="Text Text__body3"><a href="https://www.goodreads.com/review/show/{100000 + i}">March {i % 28 + 1}, 2021</a></span></section></section>
+<section class="ReviewText ReviewText__content"><div class="TruncatedContent"><div class="TruncatedContent__text"><span class="Formatted">{"I have a lot to say about this book. " * (2 + i % 10)}</span></div></div></section>
+</section></article>
+''' for i in range(reviews))
+    return f'''<html><body>
+<div class="BookPageTitleSection"><h1><a data-testid="title" href="/book/show/1885">Pride and Prejudice</a></h1></div>
+<div class="ContributorLinksList"><a href="/author/show/1265">Jane Austen</a></div>
+<div class="ReviewsList">
+{cards}</div>
+</body></html>
+'''
+
+
+def generate_fixtures(directory):
+    """Write the synthetic fixture set: deterministic, so the same code always benchmarks the same pages."""
+    os.makedirs(directory, exist_ok=True)
+    fixtures = {'book_small.html': _book_page('A Small Book', editions=1, genres=3, friend_reviews=3),
+                'book_classic.html': _book_page('Pride and   Prejudice', editions=5, genres=40, friend_reviews=300),
+                'shelves.html': _shelves_page(100),
+                'lists.html': _lists_page(100, 1, 12),
+                'reviews_3000.html': _reviews_page(3000)}
+    for file_name, source in fixtures.items():
+        with open(os.path.join(directory, file_name), 'w', encoding='utf-8') as f:
+            f.write(source)
+    return list(fixtures)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures_dir', '--pages_dir', type=str, default='fixtures',
+                        help="Folder containing book, top shelves, lists and reviews pages (.html)")
+    parser.add_argument('--generate', action='store_true', help="(re)write the synthetic fixture pages first")
+    parser.add_argument('--repeat', type=int, default=5, help="number of timed runs per page and backend, the best one counts")
+    parser.add_argument('--baseline', type=str, default=BASELINE_FILE, help="file of baseline results")
+    parser.add_argument('--save_baseline', action='store_true', help="save the results of this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown against the baseline reported as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.generate:
+        print(f'Wrote {", ".join(generate_fixtures(args.fixtures_dir))} to {args.fixtures_dir}')
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    pages = sorted(f for f in os.listdir(args.fixtures_dir) if f.endswith('.html'))
+    print(f'{datetime.now()} Benchmarking {len(pages)} pages, {args.repeat} runs each\n')
+
+    results = {}
+    problems = []
+    for page in pages:
+        with open(os.path.join(args.fixtures_dir, page), 'r', encoding='utf-8') as f:
+            source = f.read()
+        kind, extractions = candidates(source)
+        print(f'{page} ({kind}, {len(source) / 1024:.0f} KB)')
+
+        expected = None
+        for name, extract in extractions.items():
+            output = extract(source)
+            if expected is None:
+                expected = output
+            elif name == 'before':
+                # the old extraction only had the main page fields
+                if any(expected[field] != value for field, value in output.items()):
+                    problems.append(f'MISMATCH: {page} extracts differently with the single-pass pipeline')
+            elif output != expected:
+                problems.append(f'MISMATCH: {page} extracts differently with {name}')
+
+            seconds = measure(extract, source, args.repeat)
+            peak = peak_memory(source, name)
+            result = {'pages_per_sec': 1 / seconds, 'peak_memory_mb': peak / 2 ** 20}
+            if kind == 'reviews':
+                result['reviews_per_sec'] = len(output[1]) / seconds
+            key = f'{page}:{name}'
+            results[key] = result
+
+            line = f'  {name:7} {result["pages_per_sec"]:8.1f} pages/s'
+            if kind == 'reviews':
+                line += f' {result["reviews_per_sec"]:9.0f} reviews/s'
+            line += f' {result["peak_memory_mb"]:8.2f} MB peak'
+            if key in baseline:
+                slowdown = baseline[key]['pages_per_sec'] / result['pages_per_sec'] - 1
+                line += f' {-slowdown:+.0%} vs baseline'
+                if slowdown > args.tolerance:
+                    problems.append(f'REGRESSION: {page} with {name} is {slowdown:.0%} slower than the baseline')
+            print(line)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nSaved the baseline to {args.baseline}')
+
+    if problems:
+        print('\n' + '\n'.join(problems))
+        sys.exit(1)
+    print('\nAll backends agree' + (', no regressions.' if baseline else '.'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+BeautifulSoup extractors for Goodreads book, top shelves, lists, series and author pages.
+
+book_lxml.py has the same functions on top of lxml; get_books.py picks one with --parser.
+"""
+import re
+
+import bs4
+
+
+SERIES_NAME_RE = re.compile(r'\((.*?)\)')
+YEAR_RE = re.compile(r'([0-9]{3,4})')
+
+
+def parse_book_page(source):
+    return bs4.BeautifulSoup(source, 'html.parser')
+
+
+def parse_page(source):
+    # shelves and lists pages
+    return bs4.BeautifulSoup(source, 'lxml')
+
+
+def get_title(soup):
+    return ' '.join(soup.find('h1', {'id': 'bookTitle'}).text.split())
+
+
+def get_genres(soup):
+    genres = []
+    for node in soup.find_all('div', {'class': 'left'}):
+        current_genres = node.find_all('a', {'class': 'actionLinkLite bookPageGenreLink'})
+        current_genre = ' > '.join([g.text for g in current_genres])
+        if current_genre.strip():
+            genres.append(current_genre)
+    return genres
+
+
+def get_series_name(soup):
+    series = soup.find(id="bookSeries").find("a")
+    if series:
+        series_name = SERIES_NAME_RE.search(series.text).group(1)
+        return series_name
+    else:
+        return ""
+
+
+def get_series_uri(soup):
+    series = soup.find(id="bookSeries").find("a")
+    if series:
+        series_uri = series.get("href")
+        return series_uri
+    else:
+        return ""
+
+
+def get_top_5_other_editions(soup):
+    other_editions = []
+    for div in soup.findAll('div', {'class': 'otherEdition'}):
+        other_editions.append(div.find('a')['href'])
+    return other_editions
+
+
+def get_num_pages(soup):
+    if soup.find('span', {'itemprop': 'numberOfPages'}):
+        num_pages = soup.find('span', {'itemprop': 'numberOfPages'}).text.strip()
+        return int(num_pages.split()[0])
+    return ''
+
+
+def get_year_first_published(soup):
+    year_first_published = soup.find('nobr', attrs={'class':'greyText'})
+    if year_first_published:
+        year_first_published = year_first_published.string
+        return YEAR_RE.search(year_first_published).group(1)
+    else:
+        return ''
+
+
+def get_authorlink(soup):
+    return soup.find('a', {'class': 'authorName'})['href']
+
+
+def get_author(soup):
+    return ' '.join(soup.find('span', {'itemprop': 'name'}).text.split())
+
+
+def get_num_ratings(soup):
+    return soup.find('meta', {'itemprop': 'ratingCount'})['content'].strip()
+
+
+def get_num_reviews(soup):
+    return soup.find('meta', {'itemprop': 'reviewCount'})['content'].strip()
+
+
+def get_average_rating(soup):
+    return soup.find('span', {'itemprop': 'ratingValue'}).text.strip()
+
+
+def get_shelves_url(soup):
+    link = soup.find('a', string='See top shelves…')
+    return link['href'] if link else None
+
+
+def get_lists_url(soup):
+    link = soup.find('a', string='More lists with this book...')
+    return link['href'] if link else None
+
+
+def get_next_page_url(soup):
+    link = soup.find('a', {'class': 'next_page'})
+    return link['href'] if link else None
+
+
+def get_page_count(soup):
+    # the highest page number in the pagination links, or None without pagination
+    pagination = soup.find('div', {'class': 'pagination'})
+    if not pagination:
+        return None
+    numbers = [int(node.text) for node in pagination.find_all(['a', 'em', 'span']) if node.text.strip().isdigit()]
+    return max(numbers) if numbers else None
+
+
+def get_shelf_texts(soup):
+    return [' '.join(node.text.strip().split()) for node in soup.find_all('div', {'class': 'shelfStat'})]
+
+
+def get_list_texts(soup):
+    return [' '.join(node.text.strip().split()) for node in soup.find_all('div', {'class': 'cell'})]
+
+
+def get_book_links(soup):
+    # the books of a series or author page
+    return [link['href'] for link in soup.find_all('a', {'class': 'bookTitle', 'href': True})]
@@ -0,0 +1,56 @@
+"""
+This script:
+- reads the history of the books' statistics that get_books keeps in snapshots.sqlite in its
+  output directory
+- with --field, writes the value of that field at every scrape of each book as CSV (book_id,
+  taken_at, value), e.g. --field num_ratings or --field shelves.to-read
+- with --as_of, writes the statistics of each book as they were at that date, as JSON lines
+"""
+import argparse
+import csv
+import json
+import sys
+from datetime import datetime
+
+from book_ids import canonical_id
+from snapshots import SnapshotStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_directory_path', type=str, required=True,
+                        help="output directory of get_books")
+    parser.add_argument('--book_ids', type=str, nargs='+', default=None,
+                        help="books to read the history of (default: all of them)")
+    parser.add_argument('--field', type=str, default=None,
+                        help="field to write the series of, or field.key for an entry of rating_distribution or shelves")
+    parser.add_argument('--as_of', type=datetime.fromisoformat, default=None,
+                        help="date (YYYY-MM-DD, or an ISO date and time) to write the statistics as of")
+    parser.add_argument('--since', type=datetime.fromisoformat, default=None,
+                        help="with --field, leave out the scrapes before this date")
+    args = parser.parse_args()
+    if bool(args.field) == bool(args.as_of):
+        parser.error('give one of --field and --as_of')
+
+    snapshots = SnapshotStore.open(args.output_directory_path)
+    try:
+        book_ids = [canonical_id(book_id) for book_id in args.book_ids] if args.book_ids else snapshots.books()
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.field:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['book_id', 'taken_at', args.field])
+        for book_id in book_ids:
+            for taken_at, value in snapshots.series(book_id, args.field, since=args.since):
+                writer.writerow([book_id, taken_at.isoformat(), json.dumps(value) if isinstance(value, dict) else value])
+    else:
+        for book_id in book_ids:
+            state = snapshots.as_of(book_id, args.as_of)
+            if state is not None:
+                print(json.dumps({'book_id': book_id, 'as_of': args.as_of.isoformat(), **state}))
+    snapshots.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Canonical Goodreads book IDs, shared by get_books and get_reviews.
+
+The same book turns up as 1885.Pride_and_Prejudice (most_popular_classics.txt), as a url like
+https://www.goodreads.com/book/show/57099452-strange-beasts-of-china (goodreads_books.txt), or as a
+bare 1885. canonical_id() maps all of them to the numeric ID, which is what the input files are
+deduplicated on and what the manifest checks past runs by, so a book is never fetched twice
+under two spellings.
+
+shard_of() splits books between machines (--shard_index/--shard_count) on a stable hash of the
+canonical ID, so every node agrees on which books are its own without talking to the others.
+"""
+import hashlib
+import re
+
+
+BOOK_URL = 'https://www.goodreads.com/book/show/'
+
+BOOK_PATH_RE = re.compile(r'/book/show/([^/?#]+)')
+CANONICAL_ID_RE = re.compile(r'([0-9]+)(?:[.\-_]|$)')
+
+
+def book_slug(value):
+    """What follows /book/show/ in the url of a book: '1885.Pride_and_Prejudice', '57099452-strange-beasts-of-china' or '1885'."""
+    value = value.strip()
+    match = BOOK_PATH_RE.search(value)
+    return match.group(1) if match else value
+
+
+def book_url(value):
+    return BOOK_URL + book_slug(value)
+
+
+def canonical_id(value):
+    """The numeric Goodreads ID of a book ID, slug or url; ValueError if there is none."""
+    match = CANONICAL_ID_RE.match(book_slug(value))
+    if not match:
+        raise ValueError(f'Not a Goodreads book ID or url: {value!r}')
+    return match.group(1)
+
+
+def read_book_ids(paths):
+    """The non-blank lines of every file in `paths`, in order."""
+    lines = []
+    for path in paths:
+        with open(path, 'r') as f:
+            lines += [line.strip() for line in f if line.strip()]
+    return lines
+
+
+def dedupe(values):
+    """(canonical ID, value) of the first spelling of every book in `values`, and the values that repeat one."""
+    unique = {}
+    duplicates = []
+    for value in values:
+        book_id = canonical_id(value)
+        if book_id in unique:
+            duplicates.append(value)
+        else:
+            unique[book_id] = value
+    return list(unique.items()), duplicates
+
+
+def shard_of(value, shard_count):
+    """The shard (0 to shard_count - 1) a book belongs to, the same on every machine and every run."""
+    digest = hashlib.sha1(canonical_id(value).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def select_shard(values, shard_index, shard_count):
+    """The books in `values` that belong to shard `shard_index`."""
+    return [value for value in values if shard_of(value, shard_count) == shard_index]
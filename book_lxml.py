@@ -0,0 +1,149 @@
+"""
+lxml extractors for Goodreads book, top shelves, lists, series and author pages.
+
+Same functions and output as book_bs4.py, but every field is read with an XPath compiled once at
+import time, so a page costs one lxml parse plus a handful of XPath evaluations.
+"""
+import re
+
+import lxml.html
+from lxml import etree
+
+
+SERIES_NAME_RE = re.compile(r'\((.*?)\)')
+YEAR_RE = re.compile(r'([0-9]{3,4})')
+
+
+def _has_class(name):
+    # the XPath equivalent of BeautifulSoup's {'class': name}, which matches any one of the classes
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+TITLE = etree.XPath('//h1[@id="bookTitle"]', smart_strings=False)
+SERIES = etree.XPath('//*[@id="bookSeries"]', smart_strings=False)
+SERIES_LINK = etree.XPath('(.//a)[1]', smart_strings=False)
+GENRE_DIVS = etree.XPath(f'//div[{_has_class("left")}]', smart_strings=False)
+GENRE_LINKS = etree.XPath('.//a[@class="actionLinkLite bookPageGenreLink"]', smart_strings=False)
+OTHER_EDITIONS = etree.XPath(f'//div[{_has_class("otherEdition")}]', smart_strings=False)
+FIRST_LINK_HREF = etree.XPath('(.//a)[1]/@href', smart_strings=False)
+NUM_PAGES = etree.XPath('//span[@itemprop="numberOfPages"]', smart_strings=False)
+YEAR_FIRST_PUBLISHED = etree.XPath(f'//nobr[{_has_class("greyText")}]', smart_strings=False)
+AUTHORLINK = etree.XPath(f'(//a[{_has_class("authorName")}])[1]/@href', smart_strings=False)
+AUTHOR = etree.XPath('//span[@itemprop="name"]', smart_strings=False)
+NUM_RATINGS = etree.XPath('(//meta[@itemprop="ratingCount"])[1]/@content', smart_strings=False)
+NUM_REVIEWS = etree.XPath('(//meta[@itemprop="reviewCount"])[1]/@content', smart_strings=False)
+AVERAGE_RATING = etree.XPath('//span[@itemprop="ratingValue"]', smart_strings=False)
+SHELVES_URL = etree.XPath('(//a[.="See top shelves…"])[1]/@href', smart_strings=False)
+LISTS_URL = etree.XPath('(//a[.="More lists with this book..."])[1]/@href', smart_strings=False)
+NEXT_PAGE_URL = etree.XPath(f'(//a[{_has_class("next_page")}])[1]/@href', smart_strings=False)
+PAGE_NUMBERS = etree.XPath(f'//div[{_has_class("pagination")}]//*[self::a or self::em or self::span]', smart_strings=False)
+SHELF_STATS = etree.XPath(f'//div[{_has_class("shelfStat")}]', smart_strings=False)
+LIST_CELLS = etree.XPath(f'//div[{_has_class("cell")}]', smart_strings=False)
+BOOK_LINKS = etree.XPath(f'//a[{_has_class("bookTitle")}]/@href', smart_strings=False)
+
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+def parse_book_page(source):
+    return lxml.html.fromstring(source)
+
+
+def parse_page(source):
+    return lxml.html.fromstring(source)
+
+
+def get_title(doc):
+    return ' '.join(TITLE(doc)[0].text_content().split())
+
+
+def get_genres(doc):
+    genres = []
+    for node in GENRE_DIVS(doc):
+        current_genre = ' > '.join([g.text_content() for g in GENRE_LINKS(node)])
+        if current_genre.strip():
+            genres.append(current_genre)
+    return genres
+
+
+def get_series_name(doc):
+    series = _first(SERIES_LINK(SERIES(doc)[0]))
+    if series is not None:
+        return SERIES_NAME_RE.search(series.text_content()).group(1)
+    return ""
+
+
+def get_series_uri(doc):
+    series = _first(SERIES_LINK(SERIES(doc)[0]))
+    if series is not None:
+        return series.get("href")
+    return ""
+
+
+def get_top_5_other_editions(doc):
+    return [FIRST_LINK_HREF(div)[0] for div in OTHER_EDITIONS(doc)]
+
+
+def get_num_pages(doc):
+    num_pages = _first(NUM_PAGES(doc))
+    if num_pages is not None:
+        return int(num_pages.text_content().strip().split()[0])
+    return ''
+
+
+def get_year_first_published(doc):
+    year_first_published = _first(YEAR_FIRST_PUBLISHED(doc))
+    if year_first_published is not None:
+        return YEAR_RE.search(year_first_published.text_content()).group(1)
+    return ''
+
+
+def get_authorlink(doc):
+    return AUTHORLINK(doc)[0]
+
+
+def get_author(doc):
+    return ' '.join(AUTHOR(doc)[0].text_content().split())
+
+
+def get_num_ratings(doc):
+    return NUM_RATINGS(doc)[0].strip()
+
+
+def get_num_reviews(doc):
+    return NUM_REVIEWS(doc)[0].strip()
+
+
+def get_average_rating(doc):
+    return AVERAGE_RATING(doc)[0].text_content().strip()
+
+
+def get_shelves_url(doc):
+    return _first(SHELVES_URL(doc))
+
+
+def get_lists_url(doc):
+    return _first(LISTS_URL(doc))
+
+
+def get_next_page_url(doc):
+    return _first(NEXT_PAGE_URL(doc))
+
+
+def get_page_count(doc):
+    numbers = [int(node.text_content()) for node in PAGE_NUMBERS(doc) if node.text_content().strip().isdigit()]
+    return max(numbers) if numbers else None
+
+
+def get_shelf_texts(doc):
+    return [' '.join(node.text_content().split()) for node in SHELF_STATS(doc)]
+
+
+def get_list_texts(doc):
+    return [' '.join(node.text_content().split()) for node in LIST_CELLS(doc)]
+
+
+def get_book_links(doc):
+    # the books of a series or author page
+    return BOOK_LINKS(doc)
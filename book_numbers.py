@@ -0,0 +1,21 @@
+"""
+The numbers of a scraped book, which the extractors return as the text of the page ('3,456,789',
+'4.28', '279'), as ints and floats, for the Parquet tables, the --refresh scheduler and the
+snapshots. A value that isn't a number (missing, or 'isbn not found'-style text) is None.
+"""
+
+
+def to_int(value):
+    """An int from '3,456,789', '3456789' or 3456789, None if it isn't one."""
+    try:
+        return int(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value):
+    """A float from '4.28' or 4.28, None if it isn't one."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
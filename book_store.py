@@ -0,0 +1,89 @@
+"""
+Where get_books keeps the metadata of each scraped book (--store).
+
+- flat: <output directory>/<book ID>_book-metadata.json, as always
+- sharded: the same files under books/ab/cd/, where abcd... is the SHA-1 of the canonical book
+  ID, so no directory grows past a few hundred entries however many books are scraped
+- sqlite: one row per book in books.sqlite, no file per book at all
+
+Every save is O(1) and returns the book's location, which the manifest keeps; enumerating books
+goes through the manifest, never through a directory listing. Locations are relative to the output
+directory, so it can be moved or copied (merge_shards.py) and read from any working directory.
+load() reads any location, so an output directory can change --store between runs.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from book_ids import canonical_id
+
+
+LAYOUTS = ['flat', 'sharded', 'sqlite']
+SQLITE_FILE = 'books.sqlite'
+SQLITE_PREFIX = 'sqlite:'
+FILE_SUFFIX = '_book-metadata.json'
+
+
+class BookStore:
+    def __init__(self, directory, layout='flat'):
+        self.directory = directory
+        self.layout = layout
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        # opened on first use, also to load books saved by an earlier run with --store sqlite
+        with self.lock:
+            if self.conn is None:
+                self.conn = sqlite3.connect(os.path.join(self.directory, SQLITE_FILE), check_same_thread=False,
+                                            isolation_level=None)
+                self.conn.execute('PRAGMA journal_mode=WAL')
+                self.conn.execute('''CREATE TABLE IF NOT EXISTS books (
+                                         book_id  TEXT PRIMARY KEY,
+                                         saved_at TEXT NOT NULL,
+                                         data     TEXT NOT NULL)''')
+            return self.conn
+
+    def location(self, book_id, layout=None):
+        """Where a book is saved, relative to the output directory."""
+        file_name = book_id + FILE_SUFFIX
+        if (layout or self.layout) == 'sharded':
+            digest = hashlib.sha1(canonical_id(book_id).encode('utf-8')).hexdigest()
+            return os.path.join('books', digest[:2], digest[2:4], file_name)
+        return file_name
+
+    def path(self, book_id):
+        return os.path.join(self.directory, self.location(book_id))
+
+    def save(self, book, book_id):
+        """Save a book and return its location."""
+        if self.layout == 'sqlite':
+            conn = self._connection()
+            with self.lock:
+                conn.execute('INSERT OR REPLACE INTO books (book_id, saved_at, data) VALUES (?, ?, ?)',
+                             (book_id, datetime.now().isoformat(), json.dumps(book)))
+            return SQLITE_PREFIX + book_id
+
+        location = self.location(book_id)
+        path = os.path.join(self.directory, location)
+        if self.layout == 'sharded':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        json.dump(book, open(path, 'w'))
+        return location
+
+    def load(self, location):
+        if location.startswith(SQLITE_PREFIX):
+            conn = self._connection()
+            with self.lock:
+                row = conn.execute('SELECT data FROM books WHERE book_id = ?', (location[len(SQLITE_PREFIX):],)).fetchone()
+            if row is None:
+                raise KeyError(f'{location} is not in {SQLITE_FILE}')
+            return json.loads(row[0])
+        return json.load(open(os.path.join(self.directory, location), 'r'))
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
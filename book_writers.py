@@ -0,0 +1,184 @@
+"""
+Streaming writers for the aggregate all_books files.
+
+Each writer either starts its file afresh or appends to what an earlier run wrote, one book at a
+time, so condensing never holds the whole corpus in memory and only costs time for new books.
+"""
+import csv
+import json
+import os
+from datetime import datetime
+
+from book_numbers import to_float, to_int
+
+
+class JsonlWriter:
+    """all_books.jsonl: one book per line, the consolidated store the other files are built alongside."""
+
+    def __init__(self, path, fresh):
+        self.file = open(path, 'w' if fresh else 'a', encoding='utf-8')
+
+    def write(self, book):
+        self.file.write(json.dumps(book) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class JsonArrayWriter:
+    """all_books.json: the JSON array of all books, appended to in place before its closing bracket."""
+
+    def __init__(self, path, fresh):
+        self.empty = True
+        if fresh or not os.path.exists(path):
+            self.file = open(path, 'wb')
+            self.file.write(b'[')
+            return
+
+        self.file = open(path, 'r+b')
+        size = self.file.seek(0, os.SEEK_END)
+        self.file.seek(size - 1)
+        if self.file.read(1) != b']':
+            raise ValueError(f'{path} is not a complete JSON array, rebuild it with --recondense')
+        self.file.seek(size - 1)
+        self.file.truncate()
+        self.empty = size <= 2
+
+    def write(self, book):
+        if not self.empty:
+            self.file.write(b', ')
+        self.file.write(json.dumps(book).encode('utf-8'))
+        self.empty = False
+
+    def close(self):
+        self.file.write(b']')
+        self.file.close()
+
+
+class CsvWriter:
+    """all_books.csv: one row per book, nested fields (shelves, lists, ...) written as their repr."""
+
+    def __init__(self, path, fresh, fields):
+        is_new = fresh or not os.path.exists(path)
+        self.file = open(path, 'w' if is_new else 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction='ignore')
+        if is_new:
+            self.writer.writeheader()
+
+    def write(self, book):
+        self.writer.writerow({field: str(value) if isinstance(value, (dict, list)) else value
+                              for field, value in book.items()})
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """all_books_parquet/: typed columnar tables, one directory per table, keyed by book_id.
+
+    - books: one row per book with typed scalar columns and the rating distribution as columns
+    - book_shelves, book_lists: (book_id, name, count) in long format
+    - book_genres: (book_id, position, genre)
+
+    Every condense adds one part file per table, so the directories read as Parquet datasets,
+    e.g. pandas.read_parquet('all_books_parquet/books', columns=['book_id', 'num_ratings']).
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, path, fresh):
+        # pyarrow is only needed for --format parquet
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pq = pq
+        self.schemas = {
+            'books': pa.schema([('book_id', pa.string()),
+                                ('book_id_title', pa.string()),
+                                ('book_title', pa.string()),
+                                ('book_series', pa.string()),
+                                ('book_series_uri', pa.string()),
+                                ('top_5_other_editions', pa.list_(pa.string())),
+                                ('isbn', pa.string()),
+                                ('isbn13', pa.string()),
+                                ('year_first_published', pa.int32()),
+                                ('authorlink', pa.string()),
+                                ('author', pa.string()),
+                                ('num_pages', pa.int32()),
+                                ('num_ratings', pa.int64()),
+                                ('num_reviews', pa.int64()),
+                                ('average_rating', pa.float64()),
+                                ('ratings_5', pa.int64()),
+                                ('ratings_4', pa.int64()),
+                                ('ratings_3', pa.int64()),
+                                ('ratings_2', pa.int64()),
+                                ('ratings_1', pa.int64())]),
+            'book_shelves': pa.schema([('book_id', pa.string()), ('shelf', pa.string()), ('count', pa.int64())]),
+            'book_lists': pa.schema([('book_id', pa.string()), ('list', pa.string()), ('count', pa.int64())]),
+            'book_genres': pa.schema([('book_id', pa.string()), ('position', pa.int16()), ('genre', pa.string())]),
+        }
+
+        if fresh and os.path.exists(path):
+            for table in self.schemas:
+                table_path = os.path.join(path, table)
+                for file_name in os.listdir(table_path) if os.path.isdir(table_path) else []:
+                    os.remove(os.path.join(table_path, file_name))
+
+        part = f'part-{datetime.now().strftime("%Y%m%d%H%M%S%f")}-{os.getpid()}.parquet'
+        self.paths = {}
+        for table in self.schemas:
+            os.makedirs(os.path.join(path, table), exist_ok=True)
+            self.paths[table] = os.path.join(path, table, part)
+        self.writers = {}
+        self.rows = {table: [] for table in self.schemas}
+
+    def write(self, book):
+        book_id = book['book_id']
+        distribution = book.get('rating_distribution') or {}
+        isbn, isbn13 = book.get('isbn'), book.get('isbn13')
+        self.rows['books'].append({
+            'book_id': book_id,
+            'book_id_title': book.get('book_id_title'),
+            'book_title': book.get('book_title'),
+            'book_series': book.get('book_series'),
+            'book_series_uri': book.get('book_series_uri'),
+            'top_5_other_editions': book.get('top_5_other_editions'),
+            'isbn': isbn if isbn != 'isbn not found' else None,
+            'isbn13': isbn13 if isbn13 != 'isbn13 not found' else None,
+            'year_first_published': to_int(book.get('year_first_published')),
+            'authorlink': book.get('authorlink'),
+            'author': book.get('author'),
+            'num_pages': to_int(book.get('num_pages')),
+            'num_ratings': to_int(book.get('num_ratings')),
+            'num_reviews': to_int(book.get('num_reviews')),
+            'average_rating': to_float(book.get('average_rating')),
+            'ratings_5': distribution.get('5 Stars'),
+            'ratings_4': distribution.get('4 Stars'),
+            'ratings_3': distribution.get('3 Stars'),
+            'ratings_2': distribution.get('2 Stars'),
+            'ratings_1': distribution.get('1 Star'),
+        })
+        self.rows['book_shelves'] += [{'book_id': book_id, 'shelf': shelf, 'count': count}
+                                      for shelf, count in (book.get('shelves') or {}).items()]
+        self.rows['book_lists'] += [{'book_id': book_id, 'list': _list, 'count': count}
+                                    for _list, count in (book.get('lists') or {}).items()]
+        self.rows['book_genres'] += [{'book_id': book_id, 'position': i, 'genre': genre}
+                                     for i, genre in enumerate(book.get('genres') or [])]
+
+        if len(self.rows['books']) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.rows.items():
+            if not rows:
+                continue
+            if table not in self.writers:
+                self.writers[table] = self.pq.ParquetWriter(self.paths[table], self.schemas[table])
+            self.writers[table].write_table(self.pa.Table.from_pylist(rows, schema=self.schemas[table]))
+            self.rows[table] = []
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
@@ -0,0 +1,79 @@
+"""
+A pool of warm browsers for get_reviews, so a book costs its page loads and not a browser start.
+
+- the browsers are started once, up front, by a `new_driver` function that has resolved the
+  driver binary already
+- a browser is quit and replaced by a fresh one after `max_uses` books (browsers slow down and
+  grow over long sessions), after a book fails with it, or on replace()
+- every browser the pool started is quit by close(), including those still checked out, or as soon
+  as one of the browsers can't be started up front
+"""
+import queue
+import threading
+
+
+class DriverPool:
+    def __init__(self, new_driver, size=1, max_uses=20):
+        self.new_driver = new_driver
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = queue.Queue()
+        self.uses = {}  # every browser started and not quit yet, with the books it was used for
+        self.lock = threading.Lock()
+        try:
+            for _ in range(size):
+                self.idle.put(self._start())
+        except Exception:
+            # no pool to close() them: quit the browsers started before the failure
+            self.close()
+            raise
+
+    def _start(self):
+        driver = self.new_driver()
+        with self.lock:
+            self.uses[driver] = 0
+        return driver
+
+    def _quit(self, driver):
+        with self.lock:
+            self.uses.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f'Could not quit the browser: {e}')
+
+    def acquire(self):
+        """A warm browser, waiting for one if all of them are in use."""
+        while True:
+            try:
+                return self.idle.get(timeout=1)
+            except queue.Empty:
+                with self.lock:
+                    if not self.uses:
+                        raise RuntimeError('No browser left in the pool, none could be started')
+
+    def replace(self, driver):
+        """Quit a browser that is in use and return a fresh one in its place."""
+        self._quit(driver)
+        return self._start()
+
+    def release(self, driver, failed=False):
+        """Hand back a browser after a book; it is recycled if the book failed or it has done `max_uses` books."""
+        with self.lock:
+            self.uses[driver] = self.uses.get(driver, 0) + 1
+            worn_out = self.uses[driver] >= self.max_uses
+        if failed or worn_out:
+            self._quit(driver)
+            try:
+                driver = self._start()
+            except Exception as e:
+                # the pool shrinks rather than failing every book waiting on it
+                print(f'Could not start a new browser: {e}')
+                return
+        self.idle.put(driver)
+
+    def close(self):
+        with self.lock:
+            drivers = list(self.uses)
+        for driver in drivers:
+            self._quit(driver)
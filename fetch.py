@@ -0,0 +1,311 @@
+"""
+Shared HTTP fetch layer for the Goodreads scripts.
+
+- keeps keep-alive connections open per host and reuses them across requests and threads
+- asks for gzip/deflate and decodes the body transparently
+- rate limits every request with a per-host token bucket
+- records the bytes received and latency of every request
+- optionally keeps responses in an on-disk cache (response_cache.py), revalidating stale pages
+  with ETag/Last-Modified, or serving only from the cache with no network at all
+- optionally archives every page it returns (page_archive.py)
+"""
+import email.utils
+import gzip
+import http.client
+import io
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import __version__ as urllib_version
+
+
+USER_AGENT = 'Python-urllib/' + urllib_version  # same as urlopen
+MAX_REDIRECTS = 5
+
+
+class NotCachedError(HTTPError):
+    """A page asked for in cache-only mode is not in the cache."""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay in seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0.0, (email.utils.parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error):
+    """The delay an HTTPError's Retry-After header asks for, or None."""
+    headers = getattr(error, 'headers', None)
+    return parse_retry_after(headers.get('Retry-After')) if headers else None
+
+
+def is_transient(error):
+    """Whether a failed fetch is worth retrying: timeouts, dropped connections, 408, 429 and 5xx."""
+    if isinstance(error, NotCachedError):
+        return False
+    if isinstance(error, HTTPError):
+        return error.code in (408, 429) or error.code >= 500
+    return isinstance(error, (URLError, OSError, http.client.HTTPException))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: refills at `rate` tokens per second and banks up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        # the host asked us to back off (429/503 with Retry-After): no tokens until then
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """One token bucket per host, shared by every worker thread."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, url):
+        self.bucket(url).acquire()
+
+    def pause(self, url, seconds):
+        self.bucket(url).pause(seconds)
+
+
+class Response:
+    def __init__(self, url, status, headers, body, nbytes, elapsed, from_cache=False):
+        self.url = url          # final url, after redirects
+        self.status = status
+        self.headers = headers
+        self.body = body        # decoded body
+        self.nbytes = nbytes    # bytes received over the wire, before decoding
+        self.elapsed = elapsed  # seconds, including redirects but not rate limiting
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.body.decode(self.headers.get_content_charset() or 'utf-8', errors='replace')
+
+
+class FetchStats:
+    """Running totals over every request made by a Fetcher."""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.elapsed = 0.0
+        self.cache_hits = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def record_cache_hit(self):
+        with self.lock:
+            self.cache_hits += 1
+
+    def record(self, response):
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += response.nbytes
+            self.bytes_decoded += len(response.body)
+            self.elapsed += response.elapsed
+            if response.from_cache:
+                self.not_modified += 1
+
+    def summary(self):
+        summary = 'No requests made.'
+        if self.requests:
+            summary = (f'{self.requests} requests, {self.bytes_received / 1024 / 1024:.1f} MB received '
+                       f'({self.bytes_decoded / 1024 / 1024:.1f} MB decoded), '
+                       f'mean latency {self.elapsed / self.requests * 1000:.0f} ms')
+        if self.cache_hits or self.not_modified:
+            summary += f' {self.cache_hits} pages served from cache, {self.not_modified} revalidated unchanged.'
+        return summary
+
+
+class ConnectionPool:
+    """Idle keep-alive connections to one host, handed out one per request."""
+
+    def __init__(self, scheme, netloc, timeout, size):
+        self.connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        self.netloc = netloc
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def get(self):
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self.connection_class(self.netloc, timeout=self.timeout), False
+
+    def put(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+def decode_body(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # some servers send raw deflate without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class Fetcher:
+    """Fetch pages over pooled, compressed connections, within a per-host request rate.
+
+    Error statuses raise urllib's HTTPError, so callers handle them exactly as with urlopen.
+    With a `cache` (response_cache.ResponseCache), fresh pages are served from disk; with
+    `cache_only` as well, a page missing from the cache raises HTTPError 504, like a proxy
+    asked for only-if-cached (NotCachedError). A 429 or 503 with Retry-After pauses all
+    requests to that host for the time asked.
+    """
+
+    def __init__(self, rate=0.5, burst=1, timeout=30, pool_size=10, cache=None, cache_only=False, archive=None):
+        self.rate_limiter = HostRateLimiter(rate, burst)
+        self.cache = cache
+        self.cache_only = cache_only
+        self.archive = archive
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.stats = FetchStats()
+
+    def _pool(self, scheme, netloc):
+        with self.lock:
+            if (scheme, netloc) not in self.pools:
+                self.pools[(scheme, netloc)] = ConnectionPool(scheme, netloc, self.timeout, self.pool_size)
+            return self.pools[(scheme, netloc)]
+
+    def _request(self, url, headers):
+        parts = urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        pool = self._pool(parts.scheme, parts.netloc)
+
+        connection, reused = pool.get()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # the server closed an idle keep-alive connection, so retry once on a fresh one
+            connection = pool.connection_class(parts.netloc, timeout=self.timeout)
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            pool.put(connection)
+        return response, body
+
+    def fetch(self, url, headers=None):
+        result = self._fetch(url, headers)
+        if self.archive:
+            # every page handed to the extractors is kept, so they can be re-run offline (page_archive.py)
+            self.archive.add(url, result.body)
+        return result
+
+    def _fetch(self, url, headers=None):
+        entry = self.cache.get(url) if self.cache else None
+        if entry and (self.cache_only or self.cache.is_fresh(entry)):
+            self.stats.record_cache_hit()
+            return Response(entry.url, entry.status, entry.headers, entry.body, 0, 0.0, from_cache=True)
+        if self.cache_only:
+            raise NotCachedError(url, 504, 'Not in cache (cache-only mode)', None, None)
+
+        request_headers = {'User-Agent': USER_AGENT,
+                           'Accept-Encoding': 'gzip, deflate',
+                           'Connection': 'keep-alive'}
+        if entry:
+            request_headers.update(self.cache.validators(entry))
+        request_headers.update(headers or {})
+
+        self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        final_url = url
+        nbytes = 0
+        for _ in range(MAX_REDIRECTS + 1):
+            response, body = self._request(final_url, request_headers)
+            nbytes += len(body)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                final_url = urljoin(final_url, response.getheader('Location'))
+                continue
+            break
+        elapsed = time.perf_counter() - start
+
+        if response.status == 304 and entry:
+            self.cache.touch(url)
+            result = Response(entry.url, entry.status, entry.headers, entry.body, nbytes, elapsed, from_cache=True)
+            self.stats.record(result)
+            return result
+
+        body = decode_body(body, response.getheader('Content-Encoding', '').lower())
+        result = Response(final_url, response.status, response.headers, body, nbytes, elapsed)
+        self.stats.record(result)
+
+        if response.status in (429, 503):
+            delay = parse_retry_after(response.getheader('Retry-After'))
+            if delay:
+                self.rate_limiter.pause(final_url, delay)
+        if response.status >= 400:
+            raise HTTPError(final_url, response.status, response.reason, response.headers, io.BytesIO(body))
+        if self.cache and response.status == 200:
+            self.cache.put(url, result)
+        return result
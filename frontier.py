@@ -0,0 +1,111 @@
+"""
+Persistent frontier of a get_books --crawl: the books found so far, breadth first from the seeds.
+
+- every book is keyed by its canonical ID (book_ids.py), so the table doubles as the seen-set and
+  a book reached through several editions, series or authors is queued once
+- each book records its depth (0 for the seeds) and the book it was found through
+- series and author pages already expanded are remembered, so a series is fetched once however
+  many of its books are crawled
+- crawl.sqlite lives in the output directory: a run that stops midway resumes from the books
+  still queued, and a run with a higher --max_depth carries on from the books at the old one
+"""
+import os
+import sqlite3
+import threading
+
+from book_ids import canonical_id
+
+
+FRONTIER_FILE = 'crawl.sqlite'
+
+QUEUED = 'queued'
+EXPANDED = 'expanded'
+AT_MAX_DEPTH = 'at_max_depth'  # scraped but not expanded, queued again when --max_depth is raised
+DEAD = 'dead'
+
+
+class Frontier:
+    def __init__(self, path, max_depth=2, max_books=1000):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_books = max_books
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS books (
+                                     canonical_id TEXT PRIMARY KEY,
+                                     book_id      TEXT NOT NULL,
+                                     depth        INTEGER NOT NULL,
+                                     via          TEXT,
+                                     state        TEXT NOT NULL)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS books_state ON books (state, depth)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY)')
+            self.conn.execute('UPDATE books SET state = ? WHERE state = ? AND depth < ?', (QUEUED, AT_MAX_DEPTH, max_depth))
+
+    @classmethod
+    def open(cls, output_directory_path, max_depth=2, max_books=1000):
+        return cls(os.path.join(output_directory_path, FRONTIER_FILE), max_depth, max_books)
+
+    def add_seeds(self, book_ids):
+        # seeds are always crawled, even past --max_books
+        with self.lock:
+            self.conn.executemany('INSERT OR IGNORE INTO books (canonical_id, book_id, depth, state) VALUES (?, ?, 0, ?)',
+                                  [(canonical_id(book_id), book_id, QUEUED) for book_id in book_ids])
+
+    def queued(self):
+        """The books still to crawl, breadth first."""
+        with self.lock:
+            rows = self.conn.execute('SELECT book_id FROM books WHERE state = ? ORDER BY depth, rowid', (QUEUED,)).fetchall()
+        return [row['book_id'] for row in rows]
+
+    def depth(self, book_id):
+        with self.lock:
+            row = self.conn.execute('SELECT depth FROM books WHERE canonical_id = ?', (canonical_id(book_id),)).fetchone()
+        return row['depth'] if row else 0
+
+    def should_expand(self, book_id):
+        return self.depth(book_id) < self.max_depth
+
+    def page_seen(self, url):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM pages WHERE url = ?', (url,)).fetchone() is not None
+
+    def expanded(self, book_id, links, pages):
+        """Record what a book links to and return the newly queued books, within --max_depth and --max_books."""
+        added = []
+        with self.lock:
+            # IMMEDIATE: get_books processes sharing a --shared_queue expand books into the same crawl
+            self.conn.execute('BEGIN IMMEDIATE')
+            depth = self.conn.execute('SELECT depth FROM books WHERE canonical_id = ?', (canonical_id(book_id),)).fetchone()
+            depth = depth['depth'] if depth else 0
+            size = self.conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+            for link in links if depth < self.max_depth else []:
+                if size >= self.max_books:
+                    break
+                cursor = self.conn.execute('''INSERT OR IGNORE INTO books (canonical_id, book_id, depth, via, state)
+                                              VALUES (?, ?, ?, ?, ?)''', (canonical_id(link), link, depth + 1, book_id, QUEUED))
+                if cursor.rowcount:
+                    added.append(link)
+                    size += 1
+            self.conn.executemany('INSERT OR IGNORE INTO pages (url) VALUES (?)', [(url,) for url in pages])
+            self.conn.execute('UPDATE books SET state = ? WHERE canonical_id = ?',
+                              (EXPANDED if depth < self.max_depth else AT_MAX_DEPTH, canonical_id(book_id)))
+            self.conn.execute('COMMIT')
+        return added
+
+    def dead(self, book_id):
+        with self.lock:
+            self.conn.execute('UPDATE books SET state = ? WHERE canonical_id = ?', (DEAD, canonical_id(book_id)))
+
+    def requeue_dead(self):
+        with self.lock:
+            self.conn.execute('UPDATE books SET state = ? WHERE state = ?', (QUEUED, DEAD))
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute('SELECT state, COUNT(*) FROM books GROUP BY state').fetchall())
+
+    def close(self):
+        self.conn.close()
@@ -1,127 +1,184 @@
 import argparse
 from datetime import datetime
-import json
+import importlib
+import itertools
+import multiprocessing
 import os
 import re
+import shutil
 import time
 
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from urllib.error import HTTPError
-import bs4
-import pandas as pd
-
-
-def get_all_lists(soup):
-
-    lists = []
-    list_count_dict = {}
-
-    if soup.find('a', text='More lists with this book...'):
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import book_bs4
+import book_lxml
+from book_ids import BOOK_URL, book_slug, canonical_id, dedupe, read_book_ids, select_shard
+from book_numbers import to_int
+from book_store import LAYOUTS, BookStore
+from book_writers import CsvWriter, JsonArrayWriter, JsonlWriter, ParquetWriter
+from fetch import Fetcher, is_transient, retry_after
+from frontier import Frontier
+from manifest import DEAD, DONE, FAILED, Manifest
+from metrics import BookMetrics, MetricsLog
+from page_archive import ArchiveFetcher, PageArchive
+from parse_pool import ParsePool
+from refresh import RequestBudget, requests_per_book, schedule
+from response_cache import ResponseCache
+from shared_queue import SharedQueue
+from snapshots import SnapshotStore
+from workqueue import WorkQueue
+
+
+# patterns for the fields that are read straight from the raw page text
+ISBN_RE = re.compile(r'nisbn: ([0-9]{10})')
+ISBN13_RE = re.compile(r'nisbn13: ([0-9]{13})')
+RATING_GRAPH_RE = re.compile(r'renderRatingGraph\(\s*\[([0-9,\s]+)')
+
+BOOK_FIELDS = ['book_id_title', 'book_id', 'book_title', 'book_series', 'book_series_uri', 'top_5_other_editions',
+               'isbn', 'isbn13', 'year_first_published', 'authorlink', 'author', 'num_pages', 'genres', 'shelves',
+               'lists', 'num_ratings', 'num_reviews', 'average_rating', 'rating_distribution']
+
+# fields that are read from their own pages; everything else comes from the main book page,
+# which is always fetched since the links to the other pages are on it
+FIELD_PAGES = {'shelves': 'shelves', 'lists': 'lists'}
+
+# what --crawl can follow from a book, and the field each needs
+FOLLOW_FIELDS = {'editions': 'top_5_other_editions', 'series': 'book_series_uri', 'author': 'authorlink'}
+
+# extractor backends, selected with --parser
+BACKENDS = {'bs4': book_bs4, 'lxml': book_lxml}
+
+
+# the default of one request every 2 seconds matches the old fixed time.sleep(2)
+fetcher = Fetcher(rate=0.5)
+
+
+# lists pages of every book are fetched on this pool, separate from the book workers so they never wait on each other
+MAX_LIST_PAGES = 12
+list_page_executor = ThreadPoolExecutor(max_workers=MAX_LIST_PAGES - 1)
+
+# pages are parsed on the fetching threads, or on this pool of processes with --parse_processes
+parse_pool = None
+
+
+def fetch(url, metrics=None, page='book'):
+    # every request goes through the shared fetcher, so the overall rate is the same however many workers run
+    start = time.perf_counter()
+    response = fetcher.fetch(url)
+    if metrics:
+        metrics.add_fetch(page, response, time.perf_counter() - start)
+    return response
+
+
+def _count_dict(texts):
+    # "<name> <count> <unit>" -> {name: count}
+    count_dict = {}
+    for _text in texts:
+        # _list_name = ' '.join(_list.split()[:-8])
+        # _list_rank = int(_list.split()[-8][:-2])
+        # _num_books_on_list = int(_list.split()[-5].replace(',', ''))
+        # list_count_dict[_list_name] = _list_rank / float(_num_books_on_list)     # TODO: switch this back to raw counts
+        _name = _text.split()[:-2][0]
+        _count = int(_text.split()[-2].replace(',', ''))
+        count_dict[_name] = _count
+    return count_dict
+
+
+def _page_url(url, page_number):
+    # the url of another page of the same paginated listing
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != 'page'] + [('page', str(page_number))]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def parse_page(backend_name, kind, source):
+    """Parse a top shelves, lists, series or author page: what is needed of it, and the seconds spent."""
+    backend = importlib.import_module(backend_name)
+    start = time.perf_counter()
+    page = backend.parse_page(source)
+    parsed = time.perf_counter()
+    if kind == 'shelves':
+        result = backend.get_shelf_texts(page)
+    elif kind in ('series', 'author'):
+        result = backend.get_book_links(page)
+    else:
+        result = {'texts': backend.get_list_texts(page),
+                  'next_page': backend.get_next_page_url(page),
+                  'page_count': backend.get_page_count(page)}
+    return result, {'parse': parsed - start, 'extract': time.perf_counter() - parsed}
 
-        lists_url = soup.find('a', text='More lists with this book...')['href']
 
-        source = urlopen('https://www.goodreads.com' + lists_url)
-        soup = bs4.BeautifulSoup(source, 'lxml')
-        lists += [' '.join(node.text.strip().split()) for node in soup.find_all('div', {'class': 'cell'})]
+def _parse(metrics, func, *args):
+    # on the parse pool when there is one (--parse_processes), otherwise right here on the fetching thread
+    result, seconds = parse_pool.run(func, *args) if parse_pool else func(*args)
+    for stage, stage_seconds in seconds.items():
+        metrics.add_seconds(stage, stage_seconds)
+    return result
 
-        i = 0
-        while soup.find('a', {'class': 'next_page'}) and i <= 10:
 
-            time.sleep(2)
-            next_url = 'https://www.goodreads.com' + soup.find('a', {'class': 'next_page'})['href']
-            source = urlopen(next_url)
-            soup = bs4.BeautifulSoup(source, 'lxml')
+def _fetch_page(url, kind, backend, metrics):
+    source = fetch(urljoin('https://www.goodreads.com', url), metrics, kind).text
+    return _parse(metrics, parse_page, backend.__name__, kind, source)
 
-            lists += [node.text for node in soup.find_all('div', {'class': 'cell'})]
-            i += 1
 
-        # Format lists text.
-        for _list in lists:
-            # _list_name = ' '.join(_list.split()[:-8])
-            # _list_rank = int(_list.split()[-8][:-2]) 
-            # _num_books_on_list = int(_list.split()[-5].replace(',', ''))
-            # list_count_dict[_list_name] = _list_rank / float(_num_books_on_list)     # TODO: switch this back to raw counts
-            _list_name = _list.split()[:-2][0]
-            _list_count = int(_list.split()[-2].replace(',', ''))
-            list_count_dict[_list_name] = _list_count
+def get_all_lists(lists_url, backend=book_bs4, metrics=None):
 
-    return list_count_dict
+    metrics = metrics or BookMetrics(None)
+    lists = []
 
+    if lists_url:
 
-def get_shelves(soup):
+        page = _fetch_page(lists_url, 'lists', backend, metrics)
+        lists += page['texts']
 
-    shelf_count_dict = {}
-    
-    if soup.find('a', text='See top shelves…'):
+        if page['next_page'] and page['page_count']:
+            # the first page tells how many there are, so fetch the rest at once (within the rate limit)
+            # and merge them in page order
+            urls = [_page_url(page['next_page'], page_number)
+                    for page_number in range(2, min(page['page_count'], MAX_LIST_PAGES) + 1)]
+            for other_page in list_page_executor.map(partial(_fetch_page, kind='lists', backend=backend, metrics=metrics), urls):
+                lists += other_page['texts']
 
-        # Find shelves text.
-        shelves_url = soup.find('a', text='See top shelves…')['href']
-        source = urlopen('https://www.goodreads.com' + shelves_url)
-        soup = bs4.BeautifulSoup(source, 'lxml')
-        shelves = [' '.join(node.text.strip().split()) for node in soup.find_all('div', {'class': 'shelfStat'})]
-        
-        # Format shelves text.
-        shelf_count_dict = {}
-        for _shelf in shelves:
-            _shelf_name = _shelf.split()[:-2][0]
-            _shelf_count = int(_shelf.split()[-2].replace(',', ''))
-            shelf_count_dict[_shelf_name] = _shelf_count
+        else:
+            i = 0
+            while page['next_page'] and i < MAX_LIST_PAGES - 1:
+                page = _fetch_page(page['next_page'], 'lists', backend, metrics)
+                lists += page['texts']
+                i += 1
 
-    return shelf_count_dict
+    return _count_dict(lists)
 
 
-def get_genres(soup):
-    genres = []
-    for node in soup.find_all('div', {'class': 'left'}):
-        current_genres = node.find_all('a', {'class': 'actionLinkLite bookPageGenreLink'})
-        current_genre = ' > '.join([g.text for g in current_genres])
-        if current_genre.strip():
-            genres.append(current_genre)
-    return genres
+def get_shelves(shelves_url, backend=book_bs4, metrics=None):
 
+    metrics = metrics or BookMetrics(None)
 
-def get_series_name(soup):
-    series = soup.find(id="bookSeries").find("a")
-    if series:
-        series_name = re.search(r'\((.*?)\)', series.text).group(1)
-        return series_name
-    else:
-        return ""
+    if shelves_url:
+        return _count_dict(_fetch_page(shelves_url, 'shelves', backend, metrics))
 
+    return {}
 
-def get_series_uri(soup):
-    series = soup.find(id="bookSeries").find("a")
-    if series:
-        series_uri = series.get("href")
-        return series_uri
-    else:
-        return ""
 
-def get_top_5_other_editions(soup):
-    other_editions = []
-    for div in soup.findAll('div', {'class': 'otherEdition'}):
-      other_editions.append(div.find('a')['href'])
-    return other_editions
+def get_isbn(source):
+    match = ISBN_RE.search(source)
+    if match:
+        return match.group(1)
+    return "isbn not found"
 
-def get_isbn(soup):
-    try:
-        isbn = re.findall(r'nisbn: [0-9]{10}' , str(soup))[0].split()[1]
-        return isbn
-    except:
-        return "isbn not found"
 
-def get_isbn13(soup):
-    try:
-        isbn13 = re.findall(r'nisbn13: [0-9]{13}' , str(soup))[0].split()[1]
-        return isbn13
-    except:
-        return "isbn13 not found"
+def get_isbn13(source):
+    match = ISBN13_RE.search(source)
+    if match:
+        return match.group(1)
+    return "isbn13 not found"
 
 
-def get_rating_distribution(soup):
-    distribution = re.findall(r'renderRatingGraph\([\s]*\[[0-9,\s]+', str(soup))[0]
-    distribution = ' '.join(distribution.split())
-    distribution = [int(c.strip()) for c in distribution.split('[')[1].split(',')]
+def get_rating_distribution(source):
+    distribution = [int(c.strip()) for c in RATING_GRAPH_RE.search(source).group(1).split(',')]
     distribution_dict = {'5 Stars': distribution[0],
                          '4 Stars': distribution[1],
                          '3 Stars': distribution[2],
@@ -130,63 +187,275 @@ def get_rating_distribution(soup):
     return distribution_dict
 
 
-def get_num_pages(soup):
-    if soup.find('span', {'itemprop': 'numberOfPages'}):
-        num_pages = soup.find('span', {'itemprop': 'numberOfPages'}).text.strip()
-        return int(num_pages.split()[0])
-    return ''
+def get_id(bookid):
+    return canonical_id(bookid)
+
+
+def extract_book(source, doc, book_id, backend=book_bs4, fields=BOOK_FIELDS):
+    """Extract the requested fields of the main book page.
+
+    Regex fields run over the raw page text and DOM fields share the one parse in `doc`,
+    so the tree is never re-serialised. 'shelves' and 'lists' live on their own pages and
+    are filled in by scrape_book.
+    """
+    extractors = {'book_id_title':        lambda: book_id,
+                  'book_id':              lambda: get_id(book_id),
+                  'book_title':           lambda: backend.get_title(doc),
+                  "book_series":          lambda: backend.get_series_name(doc),
+                  "book_series_uri":      lambda: backend.get_series_uri(doc),
+                  'top_5_other_editions': lambda: backend.get_top_5_other_editions(doc),
+                  'isbn':                 lambda: get_isbn(source),
+                  'isbn13':               lambda: get_isbn13(source),
+                  'year_first_published': lambda: backend.get_year_first_published(doc),
+                  'authorlink':           lambda: backend.get_authorlink(doc),
+                  'author':               lambda: backend.get_author(doc),
+                  'num_pages':            lambda: backend.get_num_pages(doc),
+                  'genres':               lambda: backend.get_genres(doc),
+                  'num_ratings':          lambda: backend.get_num_ratings(doc),
+                  'num_reviews':          lambda: backend.get_num_reviews(doc),
+                  'average_rating':       lambda: backend.get_average_rating(doc),
+                  'rating_distribution':  lambda: get_rating_distribution(source)}
+    return {field: extractors[field]() if field in extractors else None for field in fields}
+
+
+def parse_fields(fields):
+    """Turn the --fields argument into the list of fields to scrape, in output order."""
+    if not fields:
+        return BOOK_FIELDS
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested - set(BOOK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(BOOK_FIELDS)}")
+    # the ids are always kept so that every output can be joined back to its book
+    requested |= {'book_id_title', 'book_id'}
+    return [field for field in BOOK_FIELDS if field in requested]
+
+
+def plan_pages(fields):
+    """The pages that have to be fetched for each book to get `fields`."""
+    return ['book'] + [FIELD_PAGES[field] for field in fields if field in FIELD_PAGES]
+
+
+def parse_main_page(backend_name, source, book_id, fields):
+    """Parse the main book page: the book, the links to its top shelves and lists pages, and the seconds spent."""
+    backend = importlib.import_module(backend_name)
+    start = time.perf_counter()
+    doc = backend.parse_book_page(source)
+    parsed = time.perf_counter()
+    book = extract_book(source, doc, book_id, backend, fields)
+    links = {'shelves': backend.get_shelves_url(doc), 'lists': backend.get_lists_url(doc)}
+    return (book, links), {'parse': parsed - start, 'extract': time.perf_counter() - parsed}
+
+
+def scrape_book(book_id, backend=book_bs4, fields=BOOK_FIELDS, metrics=None):
+    # fetching (I/O) stays on the calling thread, parsing (CPU) goes through _parse
+    metrics = metrics or BookMetrics(book_id)
+    source = fetch(BOOK_URL + book_id, metrics).text
+    book, links = _parse(metrics, parse_main_page, backend.__name__, source, book_id, fields)
+
+    if 'shelves' in fields:
+        book['shelves'] = get_shelves(links['shelves'], backend, metrics)
+    if 'lists' in fields:
+        book['lists'] = get_all_lists(links['lists'], backend, metrics)
+    return book
+
+
+def condense_books(output_directory_path, manifest, store, formats, rebuild=False):
+    """Add the books scraped since the last condense to the all_books files and return how many.
+
+    The files are appended to, one book at a time, unless one of them is missing or `rebuild`
+    is set, in which case all of them are rewritten from every scraped book.
+    """
+    condensed_books_path = output_directory_path + '/all_books'
+    paths = {'jsonl': f'{condensed_books_path}.jsonl', 'json': f'{condensed_books_path}.json'}
+    if 'csv' in formats:
+        paths['csv'] = f'{condensed_books_path}.csv'
+    if 'parquet' in formats:
+        paths['parquet'] = f'{condensed_books_path}_parquet'
+
+    rebuild = rebuild or not all(os.path.exists(path) for path in paths.values())
+    if rebuild:
+        manifest.reset_condensed()
+
+    writers = [JsonlWriter(paths['jsonl'], rebuild), JsonArrayWriter(paths['json'], rebuild)]
+    if 'csv' in paths:
+        writers.append(CsvWriter(paths['csv'], rebuild, BOOK_FIELDS))
+    if 'parquet' in paths:
+        writers.append(ParquetWriter(paths['parquet'], rebuild))
+
+    condensed = []
+    try:
+        try:
+            for row in manifest.to_condense():
+                book = store.load(row['output_path'])
+                for writer in writers:
+                    writer.write(book)
+                condensed.append(row['book_id'])
+        finally:
+            # closed however the loop ends, so all_books.json always gets its closing bracket
+            for writer in writers:
+                writer.close()
+    except Exception:
+        # the files now hold some of the new books but not all, and none are marked condensed:
+        # drop them, so the next condense rewrites them from every scraped book
+        for path in paths.values():
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        raise
+    manifest.mark_condensed(condensed)
+    return len(condensed)
+
+
+def scrape_and_save(book_id, store, manifest, backend=book_bs4, fields=BOOK_FIELDS, metrics_log=None, snapshots=None):
+    print(str(datetime.now()) + ' ' + os.path.basename(__file__) + ': Scraping ' + book_id + '...')
+    manifest.start(book_id)
+    metrics = BookMetrics(book_id)
+    try:
+        book = scrape_book(book_id, backend, fields, metrics)
+        with metrics.stage('write'):
+            output_path = store.save(book, book_id)
+            if snapshots:
+                snapshots.add(book_id, book)
+    except Exception as e:
+        manifest.failed(book_id, repr(e))
+        if metrics_log:
+            metrics_log.write(metrics.record(FAILED, repr(e)))
+        raise
+    manifest.done(book_id, output_path, to_int(book.get('num_ratings')))
+    if metrics_log:
+        metrics_log.write(metrics.record(DONE))
+    return book
+
+
+def refresh_and_save(book_id, store, manifest, backend=book_bs4, fields=BOOK_FIELDS, metrics_log=None, snapshots=None):
+    """Re-scrape a book done in an earlier run (--refresh): the fields scraped replace those in its metadata
+    file and the others are kept. A refresh that fails leaves the book done, its error goes to the metrics."""
+    print(str(datetime.now()) + ' ' + os.path.basename(__file__) + ': Refreshing ' + book_id + '...')
+    row = manifest.get(book_id)
+    metrics = BookMetrics(book_id)
+    try:
+        scraped = scrape_book(book_id, backend, fields, metrics)
+        with metrics.stage('write'):
+            book = store.load(row['output_path'])
+            book.update(scraped)
+            output_path = store.save(book, book_id)
+            if snapshots:
+                snapshots.add(book_id, scraped)
+    except Exception as e:
+        if metrics_log:
+            metrics_log.write(metrics.record(FAILED, repr(e)))
+        raise
+    manifest.done(book_id, output_path, to_int(scraped.get('num_ratings')))
+    if metrics_log:
+        metrics_log.write(metrics.record(DONE))
+    return book
+
+
+def scrape_within_budget(book_id, work, budget):
+    """work(book_id), or None without starting it if the book could take --refresh_budget past its end."""
+    if not budget.start():
+        return None
+    try:
+        return work(book_id)
+    finally:
+        budget.finish()
+
+
+def discover_books(book, follow, frontier, backend=book_bs4, metrics=None):
+    """The books a scraped book leads to (its other editions, the books of its series and of its author),
+    and the series and author pages fetched to find them."""
+    metrics = metrics or BookMetrics(None)
+    links = list(book.get('top_5_other_editions') or []) if 'editions' in follow else []
+    pages = []
+    for kind, url in (('series', book.get('book_series_uri')), ('author', book.get('authorlink'))):
+        if kind not in follow or not url or frontier.page_seen(url):
+            continue
+        try:
+            links += _fetch_page(url, kind, backend, metrics)
+        except HTTPError as e:
+            if is_transient(e):
+                raise
+            print(f'Could not fetch the {kind} page {url} ({e})')
+        pages.append(url)
+    return [book_slug(link) for link in links if '/book/show/' in link], pages
+
+
+def crawl_book(book_id, store, manifest, frontier, follow, backend=book_bs4, fields=BOOK_FIELDS,
+               metrics_log=None, snapshots=None):
+    row = manifest.find(canonical_id(book_id))
+    if row and row['status'] == DONE:
+        # scraped in an earlier run, or under another spelling: only its links are needed
+        book = store.load(row['output_path'])
+    else:
+        book = scrape_and_save(book_id, store, manifest, backend, fields, metrics_log, snapshots)
+    links, pages = discover_books(book, follow, frontier, backend) if frontier.should_expand(book_id) else ([], [])
+    return book, links, pages
 
 
-def get_year_first_published(soup):
-    year_first_published = soup.find('nobr', attrs={'class':'greyText'})
-    if year_first_published:
-        year_first_published = year_first_published.string
-        return re.search('([0-9]{3,4})', year_first_published).group(1)
-    else:
-        return ''
+def _init_replay_worker(archive_dir):
+    # each replay process answers scrape_book's requests from its own handle on the archive
+    global fetcher
+    fetcher = ArchiveFetcher(PageArchive(archive_dir))
+
+
+def _replay_book(book_id, backend_name, fields):
+    metrics = BookMetrics(book_id)
+    try:
+        return book_id, scrape_book(book_id, BACKENDS[backend_name], fields, metrics), metrics, None
+    except Exception as e:
+        return book_id, None, metrics, repr(e)
+
+
+def replay_books(archive_dir, book_ids, store, manifest, backend_name='bs4', fields=BOOK_FIELDS,
+                 processes=None, metrics_log=None):
+    """Re-extract books from the pages archived by earlier runs, on a pool of processes and with no network.
+
+    Returns the ids of the books that could not be re-extracted.
+    """
+    failed = []
+    with multiprocessing.Pool(processes, initializer=_init_replay_worker, initargs=(archive_dir,)) as pool:
+        replay = partial(_replay_book, backend_name=backend_name, fields=fields)
+        for i, (book_id, book, metrics, error) in enumerate(pool.imap_unordered(replay, book_ids, chunksize=8)):
+            manifest.start(book_id)
+            if error:
+                manifest.failed(book_id, error)
+                if metrics_log:
+                    metrics_log.write(metrics.record(FAILED, error))
+                failed.append(book_id)
+                print(f'{book_id}: {error}')
+                continue
+            with metrics.stage('write'):
+                output_path = store.save(book, book_id)
+            manifest.done(book_id, output_path)
+            if metrics_log:
+                metrics_log.write(metrics.record(DONE))
+            print(f'Replayed {i + 1}/{len(book_ids)} books', end='\r')
+    print()
+    return failed
+
+
+def read_input_books(parser, paths, shard_index=0, shard_count=1):
+    """One book ID per book of this shard in the input files, as the slug of its first spelling."""
+    try:
+        books, duplicates = dedupe(book_slug(line) for line in read_book_ids(paths))
+    except ValueError as e:
+        parser.error(str(e))
+    if duplicates:
+        print(f'Skipping {len(duplicates)} books listed more than once: ' + ', '.join(duplicates))
+    return select_shard([book_id for _, book_id in books], shard_index, shard_count)
+
+
+def print_status(manifest):
+    counts = manifest.counts()
+    print(f'{sum(counts.values())} books in {manifest.path}')
+    for status, count in sorted(counts.items()):
+        print(f'  {status}: {count}')
+    for status in (FAILED, DEAD):
+        for row in manifest.with_status(status):
+            print(f"{status} {row['book_id']} ({row['attempts']} attempts, last at {row['fetched_at']}): {row['error']}")
 
-def get_id(bookid):
-    pattern = re.compile("([^.-]+)")
-    return pattern.search(bookid).group()
-    
-def scrape_book(book_id):
-    url = 'https://www.goodreads.com/book/show/' + book_id
-    source = urlopen(url)
-    soup = bs4.BeautifulSoup(source, 'html.parser')
-
-    time.sleep(2)
-
-    return {'book_id_title':        book_id,
-            'book_id':              get_id(book_id),
-            'book_title':           ' '.join(soup.find('h1', {'id': 'bookTitle'}).text.split()),
-            "book_series":          get_series_name(soup),
-            "book_series_uri":      get_series_uri(soup),
-            'top_5_other_editions': get_top_5_other_editions(soup),
-            'isbn':                 get_isbn(soup),
-            'isbn13':               get_isbn13(soup),
-            'year_first_published': get_year_first_published(soup),
-            'authorlink':           soup.find('a', {'class': 'authorName'})['href'],
-            'author':               ' '.join(soup.find('span', {'itemprop': 'name'}).text.split()),
-            'num_pages':            get_num_pages(soup),
-            'genres':               get_genres(soup),
-            'shelves':              get_shelves(soup),
-            'lists':                get_all_lists(soup),
-            'num_ratings':          soup.find('meta', {'itemprop': 'ratingCount'})['content'].strip(),
-            'num_reviews':          soup.find('meta', {'itemprop': 'reviewCount'})['content'].strip(),
-            'average_rating':       soup.find('span', {'itemprop': 'ratingValue'}).text.strip(),
-            'rating_distribution':  get_rating_distribution(soup)}
-
-def condense_books(books_directory_path):
-
-    books = []
-    
-    # Look for all the files in the directory and if they contain "book-metadata," then load them all and condense them into a single file
-    for file_name in os.listdir(books_directory_path):
-        if file_name.endswith('.json') and not file_name.startswith('.') and file_name != "all_books.json" and "book-metadata" in file_name:
-            _book = json.load(open(books_directory_path + '/' + file_name, 'r')) #, encoding='utf-8', errors='ignore'))
-            books.append(_book)
-
-    return books
 
 def main():
 
@@ -194,43 +463,283 @@ def main():
     script_name = os.path.basename(__file__)
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('--book_ids_path', type=str)
+    parser.add_argument('--book_ids_path', type=str, nargs='+',
+                        help="files of book IDs, slugs or urls, one per line; a book listed more than once "
+                             "(under any spelling) is scraped once")
     parser.add_argument('--output_directory_path', type=str)
     parser.add_argument('--format', type=str, action="store", default="json",
-                        dest="format", choices=["json", "csv"],
+                        dest="format", choices=["json", "csv", "parquet"],
                         help="set file output format")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="number of books scraped concurrently")
+    parser.add_argument('--rate', type=float, default=0.5,
+                        help="maximum requests per second sent to each host")
+    parser.add_argument('--burst', type=int, default=1,
+                        help="number of requests that may be sent back to back before --rate applies")
+    parser.add_argument('--timeout', type=float, default=30,
+                        help="seconds to wait for a connection or a response before giving up")
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help="keep fetched pages in this directory and reuse them on later runs")
+    parser.add_argument('--cache_ttl', type=float, default=7,
+                        help="days a cached page is used as is before it is revalidated with Goodreads")
+    parser.add_argument('--cache_only', action='store_true',
+                        help="serve every page from --cache_dir and never touch the network")
+    parser.add_argument('--archive_dir', type=str, default=None,
+                        help="keep every fetched page, compressed, in this directory so books can be re-extracted with --replay")
+    parser.add_argument('--replay', action='store_true',
+                        help="re-extract books from the pages in --archive_dir, without any network access "
+                             "(all archived books, or those in --book_ids_path)")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="processes used by --replay (default: one per CPU)")
+    parser.add_argument('--parse_processes', type=int, default=0,
+                        help="parse pages on this many processes while the --workers threads keep fetching "
+                             "(default: parse on the worker threads)")
+    parser.add_argument('--parser', type=str, default="bs4", choices=list(BACKENDS),
+                        help="extractor backend: bs4 (BeautifulSoup) or lxml (compiled XPath, faster)")
+    parser.add_argument('--fields', type=str, default=None,
+                        help="comma-separated fields to scrape, e.g. num_ratings,average_rating,rating_distribution; "
+                             "pages not needed for them are not fetched (default: all fields)")
+    parser.add_argument('--status', action='store_true',
+                        help="print how many books are done or failed in the output directory, and which failed, then exit")
+    parser.add_argument('--max_attempts', type=int, default=5,
+                        help="attempts per book before it is given up on and moved to the dead letters")
+    parser.add_argument('--retry_dead', action='store_true',
+                        help="try again the books given up on in earlier runs")
+    parser.add_argument('--recondense', action='store_true',
+                        help="rewrite the all_books files from every scraped book instead of appending the new ones")
+    parser.add_argument('--store', type=str, default='flat', choices=LAYOUTS,
+                        help="how the metadata of each book is kept: flat (one file per book in the output directory), "
+                             "sharded (files in hashed subdirectories) or sqlite (rows in books.sqlite)")
+    parser.add_argument('--shard_index', type=int, default=0,
+                        help="which shard of the books this node scrapes, from 0 to --shard_count - 1")
+    parser.add_argument('--shard_count', type=int, default=1,
+                        help="split the books between this many nodes, by a stable hash of their ID; "
+                             "combine the output directories with merge_shards.py")
+    parser.add_argument('--shared_queue', action='store_true',
+                        help="take the books from jobs.sqlite in the output directory, shared with the other get_books "
+                             "processes started on it with --shared_queue, so each book is fetched by one of them")
+    parser.add_argument('--lease_seconds', type=float, default=60,
+                        help="how long a book claimed by a --shared_queue process that stopped responding stays "
+                             "with it before another process takes it over")
+    parser.add_argument('--refresh', action='store_true',
+                        help="scrape again the books scraped before (those of --book_ids_path, or all of them) that are "
+                             "most out of date: the oldest, weighted by how fast their num_ratings grows")
+    parser.add_argument('--refresh_top', type=int, default=None,
+                        help="refresh at most this many books")
+    parser.add_argument('--refresh_budget', type=int, default=None,
+                        help="refresh at most as many books as this many requests allow, estimated from the metrics file "
+                             "and enforced while scraping")
+    parser.add_argument('--refresh_min_age', type=float, default=1,
+                        help="never refresh books scraped less than this many days ago")
+    parser.add_argument('--crawl', action='store_true',
+                        help="also scrape the books the input books lead to, breadth first, through --follow; "
+                             "the crawl is kept in crawl.sqlite in the output directory and resumes where it stopped")
+    parser.add_argument('--follow', type=str, default=','.join(FOLLOW_FIELDS),
+                        help="what --crawl follows, comma-separated: editions (the top 5 other editions), "
+                             "series (the books of the series) and author (the author's books)")
+    parser.add_argument('--max_depth', type=int, default=2,
+                        help="how many links away from the input books --crawl goes")
+    parser.add_argument('--max_books', type=int, default=1000,
+                        help="stop adding books to --crawl once it has found this many")
+    parser.add_argument('--metrics_path', type=str, default=None,
+                        help="file the per-book fetch, parse, extract and write timings are appended to as JSON lines "
+                             "(default: metrics.jsonl in the output directory)")
     args = parser.parse_args()
 
-    book_ids              = [line.strip() for line in open(args.book_ids_path, 'r') if line.strip()]
-    books_already_scraped =  [file_name.replace('_book-metadata.json', '') for file_name in os.listdir(args.output_directory_path) if file_name.endswith('.json') and not file_name.startswith('all_books')]
-    books_to_scrape       = [book_id for book_id in book_ids if book_id not in books_already_scraped]
-    condensed_books_path   = args.output_directory_path + '/all_books'
-
-    for i, book_id in enumerate(books_to_scrape):
-        try:
-            print(str(datetime.now()) + ' ' + script_name + ': Scraping ' + book_id + '...')
-            print(str(datetime.now()) + ' ' + script_name + ': #' + str(i+1+len(books_already_scraped)) + ' out of ' + str(len(book_ids)) + ' books')
-
-            book = scrape_book(book_id)
-            # Add book metadata to file name to be more specific
-            json.dump(book, open(args.output_directory_path + '/' + book_id + '_book-metadata.json', 'w'))
-
-            print('=============================')
+    try:
+        fields = parse_fields(args.fields)
+    except ValueError as e:
+        parser.error(str(e))
+    follow = [kind.strip() for kind in args.follow.split(',') if kind.strip()]
+    if set(follow) - set(FOLLOW_FIELDS):
+        parser.error(f"Unknown --follow: {', '.join(sorted(set(follow) - set(FOLLOW_FIELDS)))}. "
+                     f"Choose from: {', '.join(FOLLOW_FIELDS)}")
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error('--shard_index must be between 0 and --shard_count - 1')
+    if args.crawl and args.shard_count > 1:
+        # the books a crawl finds are only known once their neighbours are scraped, on whichever node
+        parser.error('--crawl cannot be split into shards')
+    if args.refresh and args.crawl:
+        parser.error('--refresh and --crawl cannot be combined')
+    if args.refresh_budget is not None and args.shared_queue:
+        # each process only counts the requests it made itself
+        parser.error('--refresh_budget cannot be shared between --shared_queue processes')
+    if args.crawl:
+        # the crawl needs the fields its links come from
+        fields = [field for field in BOOK_FIELDS if field in fields or field in [FOLLOW_FIELDS[kind] for kind in follow]]
+
+    # with --shared_queue, books other processes finish from here on are not queued again
+    queue_started_at = time.time()
+    manifest = Manifest.open(args.output_directory_path)
+    if args.status:
+        print_status(manifest)
+        return
+
+    store = BookStore(args.output_directory_path, args.store)
+    metrics_log = MetricsLog(args.metrics_path or os.path.join(args.output_directory_path, 'metrics.jsonl'))
+
+    if args.replay:
+        if not args.archive_dir:
+            parser.error('--replay needs --archive_dir')
+        if args.book_ids_path:
+            book_ids = read_input_books(parser, args.book_ids_path, args.shard_index, args.shard_count)
+        else:
+            archive = PageArchive(args.archive_dir)
+            book_ids = [book_id for _, book_id in dedupe(book_slug(url) for url in archive.urls(prefix=BOOK_URL))[0]]
+            book_ids = select_shard(book_ids, args.shard_index, args.shard_count)
+            archive.close()
+        print(str(datetime.now()) + ' ' + script_name + f': Replaying {len(book_ids)} books from {args.archive_dir}')
+        failed = replay_books(args.archive_dir, book_ids, store, manifest,
+                              args.parser, fields, args.processes, metrics_log)
+        if failed:
+            print(str(datetime.now()) + ' ' + script_name + f': ⚠️ {len(failed)} books could not be re-extracted')
+        # replayed books replace their earlier versions, so the aggregate files are rewritten
+        num_condensed = condense_books(args.output_directory_path, manifest, store, [args.format], rebuild=True)
+        print(str(datetime.now()) + ' ' + script_name + f': Condensed {num_condensed} books. Replay run time = ⏰ '
+              + str(datetime.now() - start_time) + ' ⏰')
+        print(f'Timings ({metrics_log.path}):\n' + metrics_log.summary())
+        metrics_log.close()
+        store.close()
+        return
+
+    if args.cache_only and not args.cache_dir:
+        parser.error('--cache_only needs --cache_dir')
+    cache = ResponseCache(args.cache_dir, ttl=args.cache_ttl * 24 * 60 * 60) if args.cache_dir else None
+
+    global fetcher, parse_pool
+    if args.parse_processes:
+        parse_pool = ParsePool(args.parse_processes)
+    fetcher = Fetcher(rate=args.rate, burst=args.burst, timeout=args.timeout, pool_size=args.workers,
+                      cache=cache, cache_only=args.cache_only,
+                      archive=PageArchive(args.archive_dir) if args.archive_dir else None)
+
+    if not args.book_ids_path and not args.crawl and not args.refresh:
+        parser.error('--book_ids_path is required')
+    book_ids              = read_input_books(parser, args.book_ids_path, args.shard_index, args.shard_count) if args.book_ids_path else []
+    skip_statuses         = {DONE} if args.retry_dead else {DONE, DEAD}
+    books_to_scrape       = [book_id for book_id in book_ids if manifest.book_status(canonical_id(book_id)) not in skip_statuses]
+    books_already_scraped = len(book_ids) - len(books_to_scrape)
+
+    if args.refresh:
+        rows = manifest.with_status(DONE)
+        if args.book_ids_path:
+            wanted = {canonical_id(book_id) for book_id in book_ids}
+            rows = [row for row in rows if row['canonical_id'] in wanted]
+        else:
+            shard = set(select_shard([row['book_id'] for row in rows], args.shard_index, args.shard_count))
+            rows = [row for row in rows if row['book_id'] in shard]
+        # a book takes a request per page, and a request per page of its lists, up to MAX_LIST_PAGES
+        book_requests = requests_per_book(metrics_log.path, plan_pages(fields), {'book': 1, 'shelves': 1, 'lists': MAX_LIST_PAGES})
+        books_to_scrape = schedule(rows, args.refresh_top, args.refresh_budget, book_requests, args.refresh_min_age)
+        book_ids = books_to_scrape
+        books_already_scraped = 0
+        print(str(datetime.now()) + ' ' + script_name + f': Refreshing the {len(books_to_scrape)} most out of date '
+              f'of {len(rows)} scraped books')
+
+    frontier = None
+    if args.crawl:
+        frontier = Frontier.open(args.output_directory_path, args.max_depth, args.max_books)
+        frontier.add_seeds(book_ids)
+        if args.retry_dead:
+            frontier.requeue_dead()
+        # books already scraped are still expanded, from their saved metadata
+        books_to_scrape = [book_id for book_id in frontier.queued()
+                           if args.retry_dead or manifest.book_status(canonical_id(book_id)) != DEAD]
+        books_already_scraped = sum(frontier.counts().values()) - len(books_to_scrape)
+        print(str(datetime.now()) + ' ' + script_name + f': Crawling {len(books_to_scrape)} queued books through '
+              + ', '.join(follow) + f', up to depth {args.max_depth} and {args.max_books} books')
+
+    print(str(datetime.now()) + ' ' + script_name + ': Fetching ' + ', '.join(plan_pages(fields)) + ' pages for each book')
+
+    progress = itertools.count(books_already_scraped + 1)
+    dead = []
+    unexpanded = []
+    not_refreshed = []
+
+    def on_success(book_id, result):
+        if result is None:
+            print(str(datetime.now()) + ' ' + script_name + f': Not refreshing {book_id}, '
+                  f'the --refresh_budget of {args.refresh_budget} requests is spent')
+            return
+        total = len(book_ids)
+        if frontier:
+            book, links, pages = result
+            for new_book_id in frontier.expanded(book_id, links, pages):
+                queue.put(new_book_id)
+            total = sum(frontier.counts().values())
+        print(str(datetime.now()) + ' ' + script_name + ': Scraped ' + book_id)
+        print(str(datetime.now()) + ' ' + script_name + ': #' + str(next(progress)) + ' out of ' + str(total) + ' books')
+        print('=============================')
+
+    def on_retry(book_id, error, attempt, delay):
+        print(str(datetime.now()) + ' ' + script_name + f': {book_id} failed ({error}), attempt {attempt}. Retrying in {delay:.0f}s')
+
+    def on_dead(book_id, error, attempts):
+        print(str(datetime.now()) + ' ' + script_name + f': Giving up on {book_id} after {attempts} attempts ({error})')
+        if args.refresh:
+            # its metadata from the last scrape is still good, it is refreshed on a later run
+            not_refreshed.append(book_id)
+            return
+        if frontier:
+            frontier.dead(book_id)
+            row = manifest.find(canonical_id(book_id))
+            if row and row['status'] == DONE:
+                # the book is scraped, only its series or author pages failed: it stays done, unexpanded
+                unexpanded.append(book_id)
+                return
+        manifest.dead(book_id, repr(error))
+        dead.append(book_id)
+
+    # every scrape adds to the history of the book's ratings and shelves, which its metadata file doesn't keep
+    snapshots = SnapshotStore.open(args.output_directory_path)
+    if frontier:
+        work = partial(crawl_book, store=store, manifest=manifest, frontier=frontier, follow=follow,
+                       backend=BACKENDS[args.parser], fields=fields, metrics_log=metrics_log, snapshots=snapshots)
+    else:
+        work = partial(refresh_and_save if args.refresh else scrape_and_save, store=store, manifest=manifest,
+                       backend=BACKENDS[args.parser], fields=fields, metrics_log=metrics_log, snapshots=snapshots)
+    if args.refresh and args.refresh_budget is not None:
+        # the estimate picked the books; the requests actually made decide when to stop
+        budget = RequestBudget(args.refresh_budget, book_requests, lambda: fetcher.stats.requests)
+        work = partial(scrape_within_budget, work=work, budget=budget)
+    shared = SharedQueue.open(args.output_directory_path, args.lease_seconds, queue_started_at) if args.shared_queue else None
+    queue = WorkQueue(work,
+                      workers=args.workers, max_attempts=args.max_attempts,
+                      is_retryable=is_transient, retry_after=retry_after, shared=shared)
+    queue.run(books_to_scrape, on_success=on_success, on_retry=on_retry, on_dead=on_dead)
+    if parse_pool:
+        parse_pool.shutdown()
+    if frontier:
+        print(str(datetime.now()) + ' ' + script_name + ': Crawl: '
+              + ', '.join(f'{count} {state}' for state, count in sorted(frontier.counts().items())))
+        frontier.close()
+
+    if dead:
+        print(str(datetime.now()) + ' ' + script_name + f': ⚠️ {len(dead)} books could not be scraped: ' + ', '.join(dead))
+        print('Run with --status to see why, and with --retry_dead to try them again.')
+    if not_refreshed:
+        print(str(datetime.now()) + ' ' + script_name + f': ⚠️ {len(not_refreshed)} books could not be refreshed and keep '
+              'their earlier metadata: ' + ', '.join(not_refreshed))
+    if unexpanded:
+        print(str(datetime.now()) + ' ' + script_name + f': ⚠️ The links of {len(unexpanded)} books could not be followed: '
+              + ', '.join(unexpanded))
+        print('Run with --retry_dead to try them again.')
+
+    # processes sharing the queue finish at about the same time, and take turns at the all_books files
+    with shared.holding('condense') if shared else nullcontext():
+        # refreshed books replace their earlier versions, so the aggregate files are rewritten
+        num_condensed = condense_books(args.output_directory_path, manifest, store, [args.format],
+                                       rebuild=args.recondense or args.refresh)
+    print(str(datetime.now()) + ' ' + script_name + f': Added {num_condensed} books to all_books')
+    if shared:
+        shared.close()
 
-        except HTTPError as e:
-            print(e)
-            exit(0)
-
-
-    books = condense_books(args.output_directory_path)
-    if args.format == 'json':
-        json.dump(books, open(f"{condensed_books_path}.json", 'w'))
-    elif args.format == 'csv':
-        json.dump(books, open(f"{condensed_books_path}.json", 'w'))
-        book_df = pd.read_json(f"{condensed_books_path}.json")
-        book_df.to_csv(f"{condensed_books_path}.csv", index=False, encoding='utf-8')
-        
     print(str(datetime.now()) + ' ' + script_name + f':\n\n🎉 Success! All book metadata scraped. 🎉\n\nMetadata files have been output to /{args.output_directory_path}\nGoodreads scraping run time = ⏰ ' + str(datetime.now() - start_time) + ' ⏰')
+    print('Network: ' + fetcher.stats.summary())
+    print(f'Timings ({metrics_log.path}):\n' + metrics_log.summary())
+    metrics_log.close()
+    snapshots.close()
+    store.close()
 
 
 
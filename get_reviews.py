@@ -1,73 +1,103 @@
 import argparse
 import csv
+import multiprocessing
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from bs4 import BeautifulSoup
-from selenium.common.exceptions import NoSuchElementException, ElementClickInterceptedException
-from urllib.error import HTTPError
+from selenium.common.exceptions import ElementClickInterceptedException
 import geckodriver_autoinstaller
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
+
+from book_ids import book_url, canonical_id, dedupe, read_book_ids, shard_of
+from driver_pool import DriverPool
+from manifest import DONE, Manifest
+from page_archive import PageArchive
+import page_waits
+from page_waits import WaitStats, clickable, wait_for
 
 
 REVIEWS_TEMP_FILE = "reviews_tmp.html"
 
+MORE_REVIEWS_XPATH = '//div[@class="lazyload-wrapper "]/div[@class="ReviewsList"]/div[4]/a'
+LOAD_PREVIOUS_XPATH = '//span[@data-testid="loadPrev"]'
+LOAD_MORE_XPATH = '//span[@data-testid="loadMore"]'
+REVIEW_CARDS = 'article.ReviewCard'
+
+# how long to wait, at most, for a button to show up and for a page or more reviews to load;
+# the waits end as soon as the page is ready, so these only matter when it never is
+BUTTON_TIMEOUT = 2
+LOAD_TIMEOUT = 15
+MAX_FAILED_CLICKS = 10  # in a row, on the loadMore button, before taking the reviews loaded so far
+
+# latencies of the waits of every browser, printed at the end of the run
+wait_stats = WaitStats()
+
+# --lean: what the browser doesn't load. The reviews are read from the page's HTML, so nothing
+# that is only drawn on screen (images, video, fonts) or that only reports back to someone
+# (ads, analytics, trackers) is needed
+BLOCKED_URLS = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.mp4', '*.webm',
+    '*googletagmanager.com*', '*google-analytics.com*', '*googlesyndication.com*', '*doubleclick.net*',
+    '*googleadservices.com*', '*amazon-adsystem.com*', '*adsafeprotected.com*', '*moatads.com*',
+    '*scorecardresearch.com*', '*quantserve.com*', '*facebook.net*', '*facebook.com/tr*', '*connect.facebook.net*',
+    '*krxd.net*', '*criteo.com*', '*pubmatic.com*', '*rubiconproject.com*', '*adnxs.com*', '*branch.io*',
+    '*fls-na.amazon.com*', '*unagi.amazon.com*',
+]
+LEAN_WINDOW_SIZE = (1024, 768)
+
 
 def _go_to_all_reviews(driver):
     # scroll to at the end of the reviews to get the 'see all reviews' button
-    SCROLL_PAUSE_TIME = 0.5
-    i = 0
-    while True:
+    for i in range(11):
         # Scroll down to bottom
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
 
         # Scroll a bit up for the All reviews button
-        height = driver.execute_script("return document.body.scrollHeight")
+        height = page_waits.height(driver)
         driver.execute_script(f"window.scrollTo(0, {height - 2000});")
 
-        # Wait to load page
-        # print(f'Scroll {i}')
-        time.sleep(SCROLL_PAUSE_TIME)
-        i += 1
-        if i > 10:
-            # too many scrollings, seems to fail
-            return False
-
-        try:
-            more_reviews_button = driver.find_element(
-                By.XPATH, '//div[@class="lazyload-wrapper "]/div[@class="ReviewsList"]/div[4]/a'
-            )
-        except NoSuchElementException:
-            time.sleep(1.5)
+        # Wait for the button to load, for as long as it takes and no longer
+        more_reviews_button = wait_for(driver, clickable(MORE_REVIEWS_XPATH), BUTTON_TIMEOUT, 'all reviews button', wait_stats)
+        if not more_reviews_button:
             continue  # try again
 
-        if more_reviews_button:
+        try:
+            more_reviews_button.click()
+        except ElementClickInterceptedException:
+            # scroll up and try again
             try:
+                driver.execute_script(f"window.scrollTo(0, {height - 1000});")
+                more_reviews_button = wait_for(driver, clickable(MORE_REVIEWS_XPATH), BUTTON_TIMEOUT, 'all reviews button', wait_stats)
                 more_reviews_button.click()
-            except ElementClickInterceptedException:
-                time.sleep(1.5)  # wait, scroll up and try again
-                try:
-                    driver.execute_script(f"window.scrollTo(0, {height - 1000});")
-                    more_reviews_button.click()
-                except Exception as e:
-                    print(e)
-                    return False
-            return True
+            except Exception as e:
+                print(e)
+                return False
+        return True
+
+    # too many scrollings, seems to fail
     return False
 
 
-def switch_reviews_mode(driver, url):
+def _load_page(driver, url):
+    driver.get(url)
+    wait_for(driver, page_waits.document_ready, LOAD_TIMEOUT, 'page load', wait_stats)
+
+
+def switch_reviews_mode(driver, url, pool=None):
     """
     From the book page, go to the reviews page.
     On selenium, you cannot go direct to the reviews page. (Will get message: Are you lost?)
+
+    Returns whether it got there, and the driver it ended up with: the browser is swapped for a
+    fresh one from the pool when the page keeps showing the wrong layout.
     """
 
     # the first load always has the pop up to register, so need to load again
-    driver.get(url)
-    time.sleep(0.5)
+    _load_page(driver, url)
 
     i = 0
     while True:
@@ -75,83 +105,77 @@ def switch_reviews_mode(driver, url):
             print('Too many tries to get the new layout. Giving up..')
             break
 
-        driver.get(url)
-        time.sleep(0.5)
+        _load_page(driver, url)
 
         if _go_to_all_reviews(driver):
-            return True  # managed to go to all reviews page
+            return True, driver  # managed to go to all reviews page
 
         print(
             f'🚨 Could not go to all reviews page - likely a pop-up or old layout🚨\n🔄 Refreshing Goodreads site..'
         )
 
         # restart driver with the hope of getting a new layout
-        driver = start_driver()
-        driver.get(url)  # first load has the pop up
-        time.sleep(0.5)
+        if pool:
+            driver = pool.replace(driver)
+        _load_page(driver, url)  # first load has the pop up
 
         i += 1
 
-    return False
+    return False, driver
+
+
+def _wait_for_more_reviews(driver, cards, height, name):
+    # new review cards, or at least a taller page while they render
+    loaded = page_waits.any_of(page_waits.count_increased(REVIEW_CARDS, cards), page_waits.height_changed(height))
+    return wait_for(driver, loaded, LOAD_TIMEOUT, name, wait_stats)
 
 
 def load_reviews(driver, pages):
     # click the 'Show previous reviews' near the top
-    time.sleep(1)
+    wait_for(driver, page_waits.document_ready, LOAD_TIMEOUT, 'page load', wait_stats)
     driver.execute_script(f"window.scrollTo(0, 400);")
-    time.sleep(1)
+    load_previous = wait_for(driver, clickable(LOAD_PREVIOUS_XPATH), BUTTON_TIMEOUT, 'loadPrev button', wait_stats)
     try:
-        driver.find_element(By.XPATH, '//span[@data-testid="loadPrev"]').click()
+        cards, height = page_waits.count(driver, REVIEW_CARDS), page_waits.height(driver)
+        load_previous.click()
         print('Show previous reviews..')
-        time.sleep(2)
+        _wait_for_more_reviews(driver, cards, height, 'previous reviews')
     except Exception as e:
         print('No previous reviews to load. Continue..')
 
-    SCROLL_PAUSE_TIME = 1.5
-
-    # Get scroll height
-    last_height = driver.execute_script("return document.body.scrollHeight")
-
     i = 0
-    while True:
-
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        # Scroll down to bottom
-        driver.execute_script(f"window.scrollTo(0, {new_height / 2});")
-        time.sleep(SCROLL_PAUSE_TIME)
-        driver.execute_script(f"window.scrollTo(0, {new_height});")
-        time.sleep(SCROLL_PAUSE_TIME)
-
-        if new_height >= last_height:
-            driver.execute_script(f"window.scrollTo(0, {new_height - 1000});")
-            # wait a bit for the button to load
-            time.sleep(SCROLL_PAUSE_TIME)
-
-            try:
-                btn = driver.find_element(By.XPATH, '//span[@data-testid="loadMore"]')
-            except NoSuchElementException:
-                print("Seems to have got all reviews.")
-                break  # finish. no more reviews.
-
-            try:
-                btn.click()
-                time.sleep(SCROLL_PAUSE_TIME)
-            except ElementClickInterceptedException:
-                print('ERROR: ElementClickInterceptedException. Sleep then continue..')
-                time.sleep(1)
-                continue
-            except Exception as e:
-                print(e)
-                print('ERROR clicking button. Continue anyway..')
-                continue
-
-            print(f'Load more reviews... {i}')
-            if i >= pages - 1:
-                print("Ok i'm done")
-                break
-            i += 1
+    failed_clicks = 0
+    while failed_clicks < MAX_FAILED_CLICKS:
+        # Scroll down to bottom, where the button is
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        btn = wait_for(driver, clickable(LOAD_MORE_XPATH), BUTTON_TIMEOUT, 'loadMore button', wait_stats)
+        if not btn:
+            print("Seems to have got all reviews.")
+            break  # finish. no more reviews.
 
-        last_height = new_height
+        cards, height = page_waits.count(driver, REVIEW_CARDS), page_waits.height(driver)
+        try:
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
+            btn.click()
+        except ElementClickInterceptedException:
+            print('ERROR: ElementClickInterceptedException. Continue..')
+            failed_clicks += 1
+            continue
+        except Exception as e:
+            print(e)
+            print('ERROR clicking button. Continue anyway..')
+            failed_clicks += 1
+            continue
+        failed_clicks = 0
+
+        if not _wait_for_more_reviews(driver, cards, height, 'more reviews'):
+            print(f'No new reviews after {LOAD_TIMEOUT}s. Trying again..')
+
+        print(f'Load more reviews... {i}')
+        if i >= pages - 1:
+            print("Ok i'm done")
+            break
+        i += 1
 
 
 def get_title_authors(source):
@@ -188,13 +212,10 @@ def get_user_type(node):
     return None
 
 
-def scrape_reviews(filename):
-    '''
-    Scrape reviews from the HTML file
-    '''
-    f = open(filename, 'r')
-    source = f.read()
-
+def parse_reviews(source):
+    """
+    Parse the reviews out of the HTML of a reviews page
+    """
     soup = BeautifulSoup(source, 'lxml')
     title, authors = get_title_authors(soup)
 
@@ -228,27 +249,216 @@ def scrape_reviews(filename):
     return title, reviews
 
 
-def start_driver(browser='chrome'):
-    # Set up driver
+def scrape_reviews(filename):
+    '''
+    Scrape reviews from the HTML file
+    '''
+    f = open(filename, 'r')
+    source = f.read()
+    f.close()
+
+    return parse_reviews(source)
+
+
+def save_reviews(output_dir, title, reviews):
+    # clean filename
+    book_filename = (
+        title.strip()
+        .replace('/', '')
+        .replace('!', '')
+        .replace(':', '')
+        .replace('.', '')
+        .replace(' ', '_')
+        .lower()
+    )
+    reviews_file = os.path.join(output_dir, f"{book_filename}_reviews.csv")
+
+    # write the reviews to csv
+    FIELDS = [
+        'title',
+        'authors',
+        'name',
+        'user_type',
+        'url',
+        'rating',
+        'date',
+        'review',
+    ]
+    with open(reviews_file, 'w') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(reviews)
+
+    return reviews_file
+
+
+def _init_replay_worker(archive_dir):
+    # each replay process reads the pages through its own handle on the archive
+    global replay_archive
+    replay_archive = PageArchive(archive_dir)
+
+
+def _replay_reviews(url):
+    try:
+        return url, parse_reviews(replay_archive.latest(url).decode('utf-8')), None
+    except Exception as e:
+        return url, None, repr(e)
+
+
+def replay_reviews(archive_dir, book_urls, output_dir, processes=None):
+    """
+    Re-parse the reviews pages archived by earlier runs, on a pool of processes, without a browser
+    """
+    with multiprocessing.Pool(processes, initializer=_init_replay_worker, initargs=(archive_dir,)) as pool:
+        for url, parsed, error in pool.imap_unordered(_replay_reviews, book_urls):
+            if error:
+                print(f'Error parsing the archived page of {url}: {error}')
+                continue
+            title, reviews = parsed
+            if len(reviews) == 0:
+                print(f"No review found for {title}.")
+            else:
+                reviews_file = save_reviews(output_dir, title, reviews)
+                print(f'Reviews have been saved to: {reviews_file}')
+
+
+def _chrome_options(lean=False):
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    if lean:
+        chrome_options.add_argument('--headless=new')
+        chrome_options.add_argument('--window-size=%d,%d' % LEAN_WINDOW_SIZE)
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_argument('--autoplay-policy=user-gesture-required')
+        chrome_options.add_argument('--mute-audio')
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2, 'profile.default_content_setting_values.notifications': 2}
+        )
+    return chrome_options
+
+
+def _start_chrome(service, chrome_options, blocked_urls=None):
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    if blocked_urls:
+        # dropped before the request is sent, for every page the browser loads from now on
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+    return driver
+
+
+def _firefox_options(lean=False):
+    from selenium.webdriver.firefox.options import Options
+
+    firefox_options = Options()
+    if lean:
+        firefox_options.add_argument('-headless')
+        firefox_options.add_argument('--width=%d' % LEAN_WINDOW_SIZE[0])
+        firefox_options.add_argument('--height=%d' % LEAN_WINDOW_SIZE[1])
+        firefox_options.set_preference('permissions.default.image', 2)
+        firefox_options.set_preference('media.autoplay.default', 5)
+        firefox_options.set_preference('browser.display.use_document_fonts', 0)
+        # Firefox has no request-level blocklist through the driver; its own tracking protection blocks the trackers
+        firefox_options.set_preference('privacy.trackingprotection.enabled', True)
+        firefox_options.set_preference('dom.webnotifications.enabled', False)
+    return firefox_options
+
+
+def driver_factory(browser='chrome', lean=False):
+    """
+    A function that starts a browser, with the driver binary downloaded or located once, here.
+    With `lean`, the browser is headless, with a small window, and loads no images, media, fonts or trackers
+    """
+    blocked_urls = BLOCKED_URLS if lean else None
     if browser.lower() == 'chrome':
-        return webdriver.Chrome(service=Service(ChromeDriverManager().install()))
+        service = Service(ChromeDriverManager().install())
+        chrome_options = _chrome_options(lean)
+        return lambda: _start_chrome(service, chrome_options, blocked_urls)
     elif browser.lower() == 'firefox':
         geckodriver_autoinstaller.install()
-        return webdriver.Firefox()
+        firefox_options = _firefox_options(lean)
+        return lambda: webdriver.Firefox(options=firefox_options)
     # Get an option to work with Google Colab
     elif browser.lower() == "colab":
-        from selenium.webdriver.chrome.options import Options
-
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
+        chrome_options = _chrome_options(lean)
+        if not lean:
+            chrome_options.add_argument("--headless")
         chrome_options.add_argument('--no-sandbox')
-        return webdriver.Chrome('/usr/lib/chromium-browser/chromedriver', options=chrome_options)
+        service = Service('/usr/lib/chromium-browser/chromedriver')
+        return lambda: _start_chrome(service, chrome_options, blocked_urls)
     else:
         print('Please select a web browser: Chrome or Firefox')
 
     return None
 
 
+def scrape_book_reviews(pool, url, output_dir, pages, manifest, archive=None):
+    """
+    Load all the reviews of a book in a browser from the pool, save them and record the outcome in the manifest
+    """
+    manifest.start(url)
+    try:
+        driver = pool.acquire()
+    except RuntimeError as e:
+        print(e)
+        manifest.failed(url, repr(e))
+        return
+    failed = True
+    try:
+        reached, driver = switch_reviews_mode(driver, url, pool)
+        if not reached:
+            print('Not able to go to reviews page. Skipping this book..')
+            manifest.failed(url, 'could not go to the reviews page')
+            return
+
+        try:
+            load_reviews(driver, pages)
+        except Exception as e:
+            print(e)
+            print('Error loading more reviews. Take whatever we have.')
+
+        print(f'Scraping {url} ...')
+
+        # Save the HTML page, under a name of its own as other browsers may be saving theirs
+        page_source = driver.page_source
+        failed = False
+        filename = os.path.join(output_dir, f'{canonical_id(url)}_{REVIEWS_TEMP_FILE}')
+        f = open(filename, "w")
+        f.write(page_source)
+        f.close()
+        if archive:
+            # keep the raw page so the reviews can be re-parsed later with --replay
+            archive.add(url, page_source.encode('utf-8'), kind='reviews')
+
+        try:
+            title, reviews = scrape_reviews(filename)
+        except Exception as e:
+            print(f'Error parsing the HTML {filename}. Skipping this book..')
+            manifest.failed(url, repr(e))
+            return
+        finally:
+            # done with temp reviews file
+            os.remove(filename)
+
+        reviews_file = None
+        if len(reviews) == 0:
+            print(f"No review found for {title}.")
+        else:
+            reviews_file = save_reviews(output_dir, title, reviews)
+            print(f'Reviews have been saved to: {reviews_file}')
+        # relative to the output directory, which may be moved or merged (merge_shards.py)
+        manifest.done(url, reviews_file and os.path.basename(reviews_file))
+
+    except Exception as e:
+        print(f'Error scraping {url}: {e}')
+        manifest.failed(url, repr(e))
+    finally:
+        # a browser that failed a book may be in any state, so the pool replaces it
+        pool.release(driver, failed)
+
+
 def main():
 
     start_time = datetime.now()
@@ -260,94 +470,99 @@ def main():
     parser.add_argument(
         '--books',
         type=str,
-        help="Text file containing gooreads book urls",
-        default="goodreads_books.txt",
+        nargs='+',
+        help="Text files containing goodreads book urls or IDs; a book listed more than once is scraped once",
+        default=["goodreads_books.txt"],
     )
     parser.add_argument('--output', type=str, help="Output directory", default="stage1_reviews")
     parser.add_argument('--browser', type=str, help="Browser to use", default="chrome")
+    parser.add_argument(
+        '--lean',
+        action='store_true',
+        help="Run the browser headless in a small window, without images, media, fonts, ads or trackers",
+    )
+    parser.add_argument(
+        '--browsers', type=int, help="Browsers kept open, each scraping one book at a time", default=1
+    )
+    parser.add_argument(
+        '--recycle_after', type=int, help="Restart a browser after it has scraped this many books", default=20
+    )
+    parser.add_argument(
+        '--archive_dir', type=str, help="Keep every reviews page, compressed, in this directory", default=None
+    )
+    parser.add_argument(
+        '--replay',
+        action='store_true',
+        help="Re-parse the reviews pages in --archive_dir instead of opening a browser",
+    )
+    parser.add_argument('--processes', type=int, help="Processes used by --replay", default=None)
+    parser.add_argument(
+        '--shard_index', type=int, help="Which shard of the books this node scrapes, from 0 to --shard_count - 1", default=0
+    )
+    parser.add_argument(
+        '--shard_count',
+        type=int,
+        help="Split the books between this many nodes, by a stable hash of their ID; combine the outputs with merge_shards.py",
+        default=1,
+    )
 
     args = parser.parse_args()
 
+    if not 0 <= args.shard_index < args.shard_count:
+        print('--shard_index must be between 0 and --shard_count - 1')
+        return
+
     # create output folder if does not exist
     if not os.path.exists(args.output):
         os.mkdir(args.output)
 
-    book_urls = [line.strip() for line in open(args.books, 'r') if line.strip()]
-
-    for i, url in enumerate(book_urls):
-        try:
-            # get a new driver for every book
-            driver = start_driver(args.browser)
-
-            if not switch_reviews_mode(driver, url):
-                print('Not able to go to reviews page. Skipping this book..')
-                continue
-
-            try:
-                load_reviews(driver, args.pages)
-            except Exception as e:
-                print(e)
-                print('Error loading more reviews. Take whatever we have.')
-
-            print(f'Scraping {url} ...')
-
-            # Save the HTML page
-            filename = os.path.join(args.output, REVIEWS_TEMP_FILE)
-            f = open(filename, "w")
-            f.write(driver.page_source)
-            f.close()
-
-            try:
-                title, reviews = scrape_reviews(filename)
-            except Exception:
-                print(f'Error parsing the HTML {filename}. Skipping this book..')
-                continue
-
-            if len(reviews) == 0:
-                print(f"No review found for {title}.")
-            else:
-                # clean filename
-                book_filename = (
-                    title.strip()
-                    .replace('/', '')
-                    .replace('!', '')
-                    .replace(':', '')
-                    .replace('.', '')
-                    .replace(' ', '_')
-                    .lower()
-                )
-                reviews_file = os.path.join(args.output, f"{book_filename}_reviews.csv")
-
-                # write the reviews to csv
-                FIELDS = [
-                    'title',
-                    'authors',
-                    'name',
-                    'user_type',
-                    'url',
-                    'rating',
-                    'date',
-                    'review',
-                ]
-                with open(reviews_file, 'w') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=FIELDS)
-                    writer.writeheader()
-                    writer.writerows(reviews)
-
-                print(f'Reviews have been saved to: {reviews_file}')
-
-            # done with temp reviews file
-            if os.path.exists(REVIEWS_TEMP_FILE):
-                os.remove(REVIEWS_TEMP_FILE)
-
-        except HTTPError:
-            pass
-        finally:
-            if driver:
-                driver.quit()
+    archive = PageArchive(args.archive_dir) if args.archive_dir else None
+
+    if args.replay:
+        if not archive:
+            print('--replay needs --archive_dir')
+            return
+        book_urls = archive.urls(kind='reviews')
+        print(f'Replaying {len(book_urls)} archived reviews pages..')
+        replay_reviews(args.archive_dir, book_urls, args.output, args.processes)
+        print(f'Goodreads replay run time = ⏰ ' + str(datetime.now() - start_time) + ' ⏰')
+        return
+
+    # books are tracked by their canonical ID (book_ids.py), so a book already scraped under
+    # another url or in an earlier run is skipped
+    manifest = Manifest.open(args.output)
+    try:
+        books, duplicates = dedupe(read_book_ids(args.books))
+    except ValueError as e:
+        parser.error(str(e))
+    if duplicates:
+        print(f'Skipping {len(duplicates)} books listed more than once: ' + ', '.join(duplicates))
+    books = [(book_id, book) for book_id, book in books if shard_of(book_id, args.shard_count) == args.shard_index]
+
+    to_scrape = []
+    for book_id, book in books:
+        if manifest.book_status(book_id) == DONE:
+            print(f'{book} was scraped in an earlier run. Skipping this book..')
+            continue
+        to_scrape.append(book_url(book))
+
+    new_driver = driver_factory(args.browser, args.lean)
+    if not new_driver:
+        return
+    # the browsers are started once and reused from book to book
+    pool = None
+    try:
+        pool = DriverPool(new_driver, size=min(args.browsers, len(to_scrape)) or 1, max_uses=args.recycle_after)
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            for url in to_scrape:
+                executor.submit(scrape_book_reviews, pool, url, args.output, args.pages, manifest, archive)
+    finally:
+        if pool:
+            pool.close()
 
     print(f'🎉 Success! All book reviews scraped. 🎉\n\n')
     print(f'Goodreads scraping run time = ⏰ ' + str(datetime.now() - start_time) + ' ⏰')
+    print('Page waits:\n' + wait_stats.summary())
 
 
 if __name__ == '__main__':
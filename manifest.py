@@ -0,0 +1,188 @@
+"""
+SQLite manifest of a get_books or get_reviews run: one row per book ID with its status, number
+of attempts, time of the last fetch, output file (relative to the output directory) and last error.
+
+Lookups go through the primary key index, so resume and skip checks stay O(1) however many
+books are in the output directory, and "what failed?" is a query instead of a directory walk.
+Every row also has the canonical (numeric) ID of its book (book_ids.py), so a book scraped
+under one spelling is found again under any other, and the num_ratings of the book at its last
+two scrapes, from which get_books --refresh tells how fast the book is changing (refresh.py).
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from book_ids import canonical_id
+
+
+MANIFEST_FILE = 'manifest.sqlite'
+
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'  # the last attempt failed, the book is retried on the next run
+DEAD = 'dead'  # gave up after repeated or permanent failures, retried only with --retry_dead
+
+# how fast a book changes, for get_books --refresh
+RATINGS_COLUMNS = {'num_ratings': 'INTEGER', 'ratings_at': 'TEXT',
+                   'previous_num_ratings': 'INTEGER', 'previous_ratings_at': 'TEXT'}
+
+
+def _canonical_id_or_none(book_id):
+    try:
+        return canonical_id(book_id)
+    except ValueError:
+        return None
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        # one connection shared by the worker threads, serialised by the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS books (
+                                     book_id     TEXT PRIMARY KEY,
+                                     status      TEXT NOT NULL,
+                                     attempts    INTEGER NOT NULL DEFAULT 0,
+                                     fetched_at  TEXT,
+                                     output_path TEXT,
+                                     error       TEXT,
+                                     condensed_at TEXT,
+                                     canonical_id TEXT,
+                                     num_ratings INTEGER,
+                                     ratings_at  TEXT,
+                                     previous_num_ratings INTEGER,
+                                     previous_ratings_at  TEXT)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS books_status ON books (status)')
+            columns = [row['name'] for row in self.conn.execute('PRAGMA table_info(books)')]
+            if 'condensed_at' not in columns:
+                # manifests written before condensing became incremental
+                self.conn.execute('ALTER TABLE books ADD COLUMN condensed_at TEXT')
+            if 'canonical_id' not in columns:
+                # manifests written before book IDs were canonicalised
+                self.conn.execute('ALTER TABLE books ADD COLUMN canonical_id TEXT')
+                rows = self.conn.execute('SELECT book_id FROM books').fetchall()
+                self.conn.executemany('UPDATE books SET canonical_id = ? WHERE book_id = ?',
+                                      [(_canonical_id_or_none(row['book_id']), row['book_id']) for row in rows])
+            self.conn.execute('CREATE INDEX IF NOT EXISTS books_canonical_id ON books (canonical_id)')
+            for column, kind in RATINGS_COLUMNS.items():
+                if column not in columns:
+                    # manifests written before --refresh
+                    self.conn.execute(f'ALTER TABLE books ADD COLUMN {column} {kind}')
+
+    @classmethod
+    def open(cls, output_directory_path):
+        """Open the manifest of an output directory, importing books scraped before it existed."""
+        path = os.path.join(output_directory_path, MANIFEST_FILE)
+        is_new = not os.path.exists(path)
+        manifest = cls(path)
+        if is_new:
+            manifest.import_directory(output_directory_path)
+        return manifest
+
+    def import_directory(self, output_directory_path):
+        # the last directory scan: from now on the manifest knows what has been scraped
+        rows = []
+        for file_name in os.listdir(output_directory_path):
+            if file_name.endswith('_book-metadata.json') and not file_name.startswith('.'):
+                book_id = file_name[:-len('_book-metadata.json')]
+                rows.append((book_id, _canonical_id_or_none(book_id), DONE, file_name))
+        with self.lock:
+            self.conn.executemany('INSERT OR IGNORE INTO books (book_id, canonical_id, status, output_path) VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def get(self, book_id):
+        with self.lock:
+            return self.conn.execute('SELECT * FROM books WHERE book_id = ?', (book_id,)).fetchone()
+
+    def status(self, book_id):
+        row = self.get(book_id)
+        return row['status'] if row else None
+
+    def is_done(self, book_id):
+        return self.status(book_id) == DONE
+
+    def find(self, canonical_id):
+        """The row of a book under whichever spelling got furthest: done, then dead, failed, in progress."""
+        with self.lock:
+            return self.conn.execute('''SELECT * FROM books WHERE canonical_id = ?
+                                        ORDER BY CASE status WHEN ? THEN 0 WHEN ? THEN 1 WHEN ? THEN 2 ELSE 3 END
+                                        LIMIT 1''', (canonical_id, DONE, DEAD, FAILED)).fetchone()
+
+    def book_status(self, canonical_id):
+        row = self.find(canonical_id)
+        return row['status'] if row else None
+
+    def start(self, book_id):
+        with self.lock:
+            self.conn.execute('''INSERT INTO books (book_id, canonical_id, status, attempts) VALUES (?, ?, ?, 1)
+                                 ON CONFLICT (book_id) DO UPDATE SET status = excluded.status, attempts = attempts + 1''',
+                              (book_id, _canonical_id_or_none(book_id), IN_PROGRESS))
+
+    def done(self, book_id, output_path, num_ratings=None):
+        """Mark a book scraped; `num_ratings` is recorded when the book was fetched just now (not replayed)."""
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.execute('UPDATE books SET status = ?, fetched_at = ?, output_path = ?, error = NULL WHERE book_id = ?',
+                              (DONE, now, output_path, book_id))
+            if num_ratings is not None:
+                self.conn.execute('''UPDATE books SET previous_num_ratings = num_ratings, previous_ratings_at = ratings_at,
+                                                      num_ratings = ?, ratings_at = ?
+                                     WHERE book_id = ?''', (num_ratings, now, book_id))
+
+    def failed(self, book_id, error):
+        with self.lock:
+            self.conn.execute('UPDATE books SET status = ?, fetched_at = ?, error = ? WHERE book_id = ?',
+                              (FAILED, datetime.now().isoformat(), str(error), book_id))
+
+    def dead(self, book_id, error):
+        with self.lock:
+            self.conn.execute('UPDATE books SET status = ?, error = ? WHERE book_id = ?', (DEAD, str(error), book_id))
+
+    def copy(self, row, output_path):
+        """Add a row of another manifest (merge_shards.py), with the output file moved to `output_path`."""
+        canonical = row['canonical_id'] or _canonical_id_or_none(row['book_id'])
+        with self.lock:
+            # the row replaces the book under any other spelling, so it is condensed once
+            self.conn.execute('DELETE FROM books WHERE canonical_id = ?', (canonical,))
+            self.conn.execute('''INSERT OR REPLACE INTO books (book_id, canonical_id, status, attempts, fetched_at, output_path, error,
+                                                           num_ratings, ratings_at, previous_num_ratings, previous_ratings_at)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (row['book_id'], canonical, row['status'],
+                               row['attempts'], row['fetched_at'], output_path, row['error'],
+                               row['num_ratings'], row['ratings_at'], row['previous_num_ratings'], row['previous_ratings_at']))
+
+    def with_status(self, status):
+        with self.lock:
+            return self.conn.execute('SELECT * FROM books WHERE status = ? ORDER BY book_id', (status,)).fetchall()
+
+    def rows(self):
+        with self.lock:
+            return self.conn.execute('SELECT * FROM books ORDER BY rowid').fetchall()
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute('SELECT status, COUNT(*) FROM books GROUP BY status').fetchall())
+
+    def to_condense(self):
+        """Books scraped (or re-scraped) since they were last added to the aggregate files."""
+        with self.lock:
+            return self.conn.execute('''SELECT book_id, output_path FROM books
+                                        WHERE status = ? AND (condensed_at IS NULL OR condensed_at < fetched_at)
+                                        ORDER BY rowid''', (DONE,)).fetchall()
+
+    def mark_condensed(self, book_ids):
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.executemany('UPDATE books SET condensed_at = ? WHERE book_id = ?', [(now, book_id) for book_id in book_ids])
+
+    def reset_condensed(self):
+        with self.lock:
+            self.conn.execute('UPDATE books SET condensed_at = NULL')
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,106 @@
+"""
+This script:
+- accepts the output directories of get_books runs split with --shard_index/--shard_count (or of
+  get_reviews runs, with --reviews)
+- copies the metadata (or reviews file) and manifest row of every book into one output directory,
+  which can already hold an earlier merge
+- a book found in more than one directory keeps its most advanced row (done, then dead, then
+  failed), and of those the most recently fetched
+- adds the snapshots of the books' statistics to snapshots.sqlite (get_books)
+- rewrites the all_books files of the merged directory (get_books)
+"""
+import argparse
+import os
+import shutil
+from datetime import datetime
+
+from book_store import LAYOUTS, BookStore
+from get_books import condense_books
+from manifest import DEAD, DONE, FAILED, Manifest
+from snapshots import SNAPSHOTS_FILE, SnapshotStore
+
+
+STATUS_ORDER = {DONE: 0, DEAD: 1, FAILED: 2}
+
+
+def _better(row, other):
+    """Whether manifest row `row` is a better version of a book than `other`."""
+    rank, other_rank = STATUS_ORDER.get(row['status'], 3), STATUS_ORDER.get(other['status'], 3)
+    if rank != other_rank:
+        return rank < other_rank
+    # ISO timestamps sort as strings
+    return (row['fetched_at'] or '') > (other['fetched_at'] or '')
+
+
+def best_rows(directories):
+    """The best manifest row of every book across `directories`, with the directory it comes from."""
+    best = {}
+    for directory in directories:
+        manifest = Manifest.open(directory)
+        for row in manifest.rows():
+            key = row['canonical_id'] or row['book_id']
+            if key not in best or _better(row, best[key][0]):
+                best[key] = (row, directory)
+        manifest.close()
+    return best
+
+
+def merge(shard_dirs, output_dir, reviews=False, layout='flat', formats=('json',)):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest.open(output_dir)
+    store = BookStore(output_dir, layout)
+    stores = {directory: BookStore(directory) for directory in shard_dirs}
+
+    merged = 0
+    for row, directory in best_rows([output_dir] + list(shard_dirs)).values():
+        if directory == output_dir:
+            continue  # the merged directory already has the best version
+        output_path = row['output_path']
+        if row['status'] == DONE and output_path:
+            if reviews:
+                shutil.copy2(os.path.join(directory, output_path), output_dir)
+            else:
+                output_path = store.save(stores[directory].load(output_path), row['book_id'])
+        manifest.copy(row, output_path)
+        merged += 1
+
+    num_condensed = None
+    if not reviews:
+        snapshots = SnapshotStore.open(output_dir)
+        for directory in shard_dirs:
+            if os.path.exists(os.path.join(directory, SNAPSHOTS_FILE)):
+                snapshots.copy_from(os.path.join(directory, SNAPSHOTS_FILE))
+        snapshots.close()
+        num_condensed = condense_books(output_dir, manifest, store, formats, rebuild=True)
+    for shard_store in stores.values():
+        shard_store.close()
+    store.close()
+    manifest.close()
+    return merged, num_condensed
+
+
+def main():
+    start_time = datetime.now()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shard_dirs', type=str, nargs='+', required=True,
+                        help="output directories of the shards")
+    parser.add_argument('--output_directory_path', type=str, required=True,
+                        help="directory the shards are merged into")
+    parser.add_argument('--reviews', action='store_true',
+                        help="the shards are get_reviews output directories")
+    parser.add_argument('--store', type=str, default='flat', choices=LAYOUTS,
+                        help="how the merged books are kept (see get_books.py --store)")
+    parser.add_argument('--format', type=str, default='json', choices=['json', 'csv', 'parquet'],
+                        help="all_books file format written besides all_books.json and all_books.jsonl")
+    args = parser.parse_args()
+
+    merged, num_condensed = merge(args.shard_dirs, args.output_directory_path, args.reviews, args.store, [args.format])
+    print(f'Merged {merged} books from {len(args.shard_dirs)} shards into {args.output_directory_path}')
+    if num_condensed is not None:
+        print(f'Condensed {num_condensed} books into all_books')
+    print(f'Merge run time = ⏰ ' + str(datetime.now() - start_time) + ' ⏰')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Per-book timings and counters for get_books, written as JSONL and summarised with percentiles.
+
+Every attempt at a book adds one line to metrics.jsonl with
+- fetches: each page fetched, with its network latency (seconds), the rest of the time the fetch
+  took, mostly waiting on the rate limit (wait_seconds), the bytes received over the wire and
+  whether it came from the cache
+- parse_seconds, extract_seconds, write_seconds: time spent in each stage, summed over the book's pages
+- fetch_seconds, wait_seconds, bytes_received and total_seconds for the whole book, its status and error
+
+The summary at the end of a run shows whether it was network, rate limit, parse or disk bound.
+"""
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+
+STAGES = ['parse', 'extract', 'write']
+
+
+class BookMetrics:
+    """The timings of one attempt at one book, recorded from every thread working on it."""
+
+    def __init__(self, book_id):
+        self.book_id = book_id
+        self.started = time.time()  # wall clock, so a record can be finished in another process (get_books --replay)
+        self.fetches = []
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.lock = threading.Lock()
+
+    def add_fetch(self, page, response, seconds):
+        # `seconds` is the wall time of the fetch call, the rest of it after the request is rate limit wait
+        with self.lock:
+            self.fetches.append({'page': page,
+                                 'url': response.url,
+                                 'seconds': round(response.elapsed, 4),
+                                 'wait_seconds': round(max(0.0, seconds - response.elapsed), 4),
+                                 'bytes': response.nbytes,
+                                 'cached': response.from_cache})
+
+    def add_seconds(self, stage, seconds):
+        # for stages timed elsewhere, e.g. parsing in another process
+        with self.lock:
+            self.seconds[stage] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_seconds(name, time.perf_counter() - start)
+
+    def record(self, status, error=None):
+        with self.lock:
+            return {'book_id': self.book_id,
+                    'time': datetime.now().isoformat(),
+                    'status': status,
+                    'error': error,
+                    'fetches': list(self.fetches),
+                    'fetch_seconds': round(sum(f['seconds'] for f in self.fetches), 4),
+                    'wait_seconds': round(sum(f['wait_seconds'] for f in self.fetches), 4),
+                    'bytes_received': sum(f['bytes'] for f in self.fetches),
+                    **{f'{stage}_seconds': round(seconds, 4) for stage, seconds in self.seconds.items()},
+                    'total_seconds': round(time.time() - self.started, 4)}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class MetricsLog:
+    """metrics.jsonl, appended to by every worker, plus the values summarised at the end of the run."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8') if path else None
+        self.values = defaultdict(list)
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        with self.lock:
+            if self.file:
+                self.file.write(json.dumps(record) + '\n')
+                self.file.flush()
+            self.counts[record['status']] += 1
+            for fetch in record['fetches']:
+                if not fetch['cached']:
+                    self.values[f"fetch {fetch['page']} (ms)"].append(fetch['seconds'] * 1000)
+                self.values['rate limit wait (ms)'].append(fetch['wait_seconds'] * 1000)
+            if record['status'] != 'done':
+                return
+            for stage in STAGES:
+                self.values[f'{stage} per book (ms)'].append(record[f'{stage}_seconds'] * 1000)
+            self.values['received per book (KB)'].append(record['bytes_received'] / 1024)
+            self.values['total per book (ms)'].append(record['total_seconds'] * 1000)
+
+    def summary(self):
+        with self.lock:
+            if not self.counts:
+                return 'No books scraped.'
+            lines = [', '.join(f'{count} {status}' for status, count in sorted(self.counts.items())),
+                     f'{"":28}{"p50":>10}{"p90":>10}{"p99":>10}{"max":>10}{"n":>8}']
+            for name, values in self.values.items():
+                values = sorted(values)
+                lines.append(f'{name:28}' + ''.join(f'{percentile(values, p):10.1f}' for p in (50, 90, 99, 100))
+                             + f'{len(values):8}')
+            return '\n'.join(lines)
+
+    def close(self):
+        if self.file:
+            self.file.close()
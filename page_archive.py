@@ -0,0 +1,92 @@
+"""
+Compressed archive of every raw page the scrapers fetch, so the extractors can be re-run offline.
+
+- bodies are stored gzip-compressed and content-addressed (bodies/ab/<sha256>.gz), so a page
+  that did not change between fetches is stored once
+- index.sqlite records every fetch: url, kind ('http' for get_books pages, 'reviews' for the
+  review pages saved by get_reviews), time and body hash
+- ArchiveFetcher serves the latest archived copy of each url in place of fetch.Fetcher, which
+  is how get_books --replay re-extracts books with no network at all
+"""
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from email.message import Message
+
+from fetch import FetchStats, NotCachedError, Response
+
+
+INDEX_FILE = 'index.sqlite'
+
+
+class PageArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'bodies'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+                                     id         INTEGER PRIMARY KEY,
+                                     url        TEXT NOT NULL,
+                                     kind       TEXT NOT NULL,
+                                     fetched_at TEXT NOT NULL,
+                                     body       TEXT NOT NULL)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS pages_url ON pages (url, id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS pages_kind ON pages (kind, url)')
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, 'bodies', digest[:2], digest + '.gz')
+
+    def add(self, url, body, kind='http'):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._body_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(body))
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.conn.execute('INSERT INTO pages (url, kind, fetched_at, body) VALUES (?, ?, ?, ?)',
+                              (url, kind, datetime.now().isoformat(), digest))
+
+    def latest(self, url):
+        """The body of the most recent fetch of `url`, or None if it was never archived."""
+        with self.lock:
+            row = self.conn.execute('SELECT body FROM pages WHERE url = ? ORDER BY id DESC LIMIT 1', (url,)).fetchone()
+        if row is None:
+            return None
+        with gzip.open(self._body_path(row[0]), 'rb') as f:
+            return f.read()
+
+    def urls(self, kind='http', prefix=''):
+        """Every archived url of a kind, optionally only those starting with `prefix`."""
+        with self.lock:
+            rows = self.conn.execute('SELECT DISTINCT url FROM pages WHERE kind = ? AND substr(url, 1, ?) = ? ORDER BY url',
+                                     (kind, len(prefix), prefix)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class ArchiveFetcher:
+    """Drop-in for fetch.Fetcher that answers every request from the archive."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.stats = FetchStats()
+
+    def fetch(self, url, headers=None):
+        body = self.archive.latest(url)
+        if body is None:
+            raise NotCachedError(url, 504, 'Not in archive (replay mode)', None, None)
+        self.stats.record_cache_hit()
+        page_headers = Message()
+        page_headers['Content-Type'] = 'text/html; charset=utf-8'
+        return Response(url, 200, page_headers, body, 0, 0.0, from_cache=True)
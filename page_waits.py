@@ -0,0 +1,105 @@
+"""
+Waits on what a page actually does, for the Selenium review loader in get_reviews.
+
+Instead of sleeping for the worst case after every scroll and click, wait_for() polls a condition
+(the number of review cards went up, the loadMore button can be clicked, the document got taller)
+and returns as soon as it holds, or gives up after a timeout. Each wait's latency is recorded per
+condition in WaitStats, which shows how fast the site really is and whether the timeouts fit it.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+
+from metrics import percentile
+
+
+POLL_SECONDS = 0.1
+
+
+class WaitStats:
+    """Latencies of every wait, by condition, and how many timed out."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, timed_out):
+        with self.lock:
+            if timed_out:
+                self.timeouts[name] += 1
+            else:
+                self.latencies[name].append(seconds)
+
+    def summary(self):
+        if not self.latencies and not self.timeouts:
+            return 'No waits.'
+        lines = [f'{"wait (s)":30}{"p50":>8}{"p90":>8}{"max":>8}{"count":>8}{"timeouts":>10}']
+        for name in sorted(set(self.latencies) | set(self.timeouts)):
+            values = sorted(self.latencies[name])
+            if values:
+                stats = ''.join(f'{value:8.2f}' for value in (percentile(values, 50), percentile(values, 90), values[-1]))
+            else:
+                stats = f'{"-":>8}' * 3
+            lines.append(f'{name:30}{stats}{len(values):8}{self.timeouts[name]:10}')
+        return '\n'.join(lines)
+
+
+def wait_for(driver, condition, timeout, name, stats=None):
+    """What `condition(driver)` returns once it is truthy, or None if it isn't within `timeout` seconds."""
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=POLL_SECONDS).until(condition)
+    except TimeoutException:
+        result = None
+    if stats:
+        stats.record(name, time.perf_counter() - start, result is None)
+    return result
+
+
+def document_ready(driver):
+    return driver.execute_script('return document.readyState') == 'complete'
+
+
+def clickable(xpath):
+    """The element at `xpath`, once it is displayed and enabled."""
+    return expected_conditions.element_to_be_clickable((By.XPATH, xpath))
+
+
+def count(driver, css_selector):
+    return len(driver.find_elements(By.CSS_SELECTOR, css_selector))
+
+
+def count_increased(css_selector, previous):
+    """The number of elements matching `css_selector`, once it is above `previous`."""
+    def condition(driver):
+        current = count(driver, css_selector)
+        return current if current > previous else False
+    return condition
+
+
+def height(driver):
+    return driver.execute_script('return document.body.scrollHeight')
+
+
+def height_changed(previous):
+    """The height of the document, once it is no longer `previous`."""
+    def condition(driver):
+        current = height(driver)
+        return current if current != previous else False
+    return condition
+
+
+def any_of(*conditions):
+    def condition(driver):
+        for check in conditions:
+            result = check(driver)
+            if result:
+                return result
+        return False
+    return condition
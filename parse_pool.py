@@ -0,0 +1,26 @@
+"""
+The CPU stage of get_books: runs the extractors on a pool of processes, out of reach of the GIL.
+
+The fetching threads hand raw pages to run() and block until they are parsed. At most
+`max_pending` pages are queued or being parsed at once, so when parsing falls behind the
+threads stop fetching (back-pressure) instead of piling up pages in memory.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class ParsePool:
+    def __init__(self, processes=None, max_pending=None):
+        # spawn, not fork: the pool starts once the fetching threads are running and holding locks
+        self.executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+        self.processes = self.executor._max_workers
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * self.processes)
+
+    def run(self, func, *args):
+        """func(*args) in one of the processes; func and its arguments must be picklable."""
+        with self.slots:
+            return self.executor.submit(func, *args).result()
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,126 @@
+"""
+Which books get_books --refresh scrapes again, out of those scraped before.
+
+Every book is scored by the number of ratings it is expected to have gained since it was last
+scraped: the age of its data (days) times its num_ratings velocity (ratings per day, between its
+last two scrapes in the manifest). A popular book scraped last week can be further out of date
+than an obscure one scraped last year, and a book whose numbers never move is never refetched
+ahead of one whose numbers do. Books with no velocity yet (scraped once) are given the median
+velocity of the others, so they age in alongside them.
+
+The highest scores are refreshed first, up to --refresh_top books or --refresh_budget requests.
+The requests a book takes are estimated from the pages fetched for it in earlier scrapes
+(metrics.jsonl): the lists of a popular book run over many pages.
+"""
+import json
+import os
+import statistics
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from metrics import percentile
+
+
+DEFAULT_VELOCITY = 1.0  # ratings per day, when no book has been scraped twice yet
+MIN_VELOCITY = 0.01  # so books whose num_ratings did not move still come up, eventually
+
+
+def requests_per_book(metrics_path, pages, worst_case):
+    """Requests expected to refresh a book: for each of `pages` ('book', 'shelves', 'lists'), the 90th
+    percentile of the requests it took in the scrapes recorded in metrics.jsonl, or `worst_case[page]`
+    when none were."""
+    counts = defaultdict(list)
+    if metrics_path and os.path.exists(metrics_path):
+        with open(metrics_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['status'] != 'done':
+                    continue
+                fetched = defaultdict(int)
+                for fetch in record['fetches']:
+                    fetched[fetch['page']] += 1
+                for page in pages:
+                    counts[page].append(fetched[page])
+    return sum(percentile(sorted(counts[page]), 90) if counts[page] else worst_case[page] for page in pages)
+
+
+def _days(since, now):
+    return (now - datetime.fromisoformat(since)).total_seconds() / 86400
+
+
+def velocity(row):
+    """Ratings per day between the last two scrapes of a manifest row, None if it was scraped once."""
+    if row['previous_num_ratings'] is None or not row['previous_ratings_at'] or not row['ratings_at']:
+        return None
+    days = _days(row['previous_ratings_at'], datetime.fromisoformat(row['ratings_at']))
+    if days <= 0:
+        return None
+    return max((row['num_ratings'] - row['previous_num_ratings']) / days, 0)
+
+
+def age(row, now):
+    """Days since the data of a manifest row was scraped, None if unknown (imported from an old output directory)."""
+    scraped_at = row['ratings_at'] or row['fetched_at']
+    return _days(scraped_at, now) if scraped_at else None
+
+
+def rank(rows, now=None):
+    """(score, age in days, book ID) of every row, highest score first; books of unknown age come first of all."""
+    now = now or datetime.now()
+    velocities = {row['book_id']: velocity(row) for row in rows}
+    known = [v for v in velocities.values() if v is not None]
+    default = statistics.median(known) if known else DEFAULT_VELOCITY
+
+    ranked = []
+    for row in rows:
+        days = age(row, now)
+        book_velocity = velocities[row['book_id']]
+        book_velocity = max(default if book_velocity is None else book_velocity, MIN_VELOCITY)
+        score = float('inf') if days is None else days * book_velocity
+        ranked.append((score, days, row['book_id']))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+
+def schedule(rows, top=None, budget=None, requests_per_book=1, min_age=0.0, now=None):
+    """The book IDs to refresh: the best ranked rows at least `min_age` days old, at most `top` of
+    them and no more than `budget` requests at `requests_per_book` each."""
+    if budget is not None:
+        top = min(top if top is not None else budget, budget // requests_per_book)
+    chosen = []
+    for score, days, book_id in rank(rows, now):
+        if top is not None and len(chosen) >= top:
+            break
+        if days is not None and days < min_age:
+            continue
+        chosen.append(book_id)
+    return chosen
+
+
+class RequestBudget:
+    """--refresh_budget while the books are scraped: a book is started only if the requests made so far,
+    plus those expected of it and of the books in progress, stay within the budget. A book is expected
+    to take `requests_per_book`, or the mean of the books finished so far when that is more."""
+
+    def __init__(self, budget, requests_per_book, spent):
+        self.budget = budget
+        self.requests_per_book = requests_per_book
+        self.spent = spent  # requests made so far
+        self.in_progress = 0
+        self.finished = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            spent = self.spent()
+            expected = max(self.requests_per_book, spent / self.finished if self.finished else 0)
+            if spent + (self.in_progress + 1) * expected > self.budget:
+                return False
+            self.in_progress += 1
+            return True
+
+    def finish(self):
+        with self.lock:
+            self.in_progress -= 1
+            self.finished += 1
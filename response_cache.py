@@ -0,0 +1,118 @@
+"""
+On-disk cache of HTTP responses for fetch.Fetcher.
+
+- bodies are stored gzip-compressed and content-addressed (named by the SHA-256 of the body),
+  so pages that did not change between runs are stored once
+- each url has a small JSON entry with the status, headers, ETag/Last-Modified and fetch time
+- entries younger than the TTL are served without any request; older ones are revalidated
+  with If-None-Match/If-Modified-Since so an unchanged page costs a 304 and no body
+"""
+import gzip
+import hashlib
+import http.client
+import io
+import json
+import os
+import time
+
+
+# headers that describe the encoded body on the wire, which no longer apply to the stored body
+WIRE_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class CacheEntry:
+    def __init__(self, url, status, headers, body, fetched_at):
+        self.url = url  # final url, after redirects
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fetched_at = fetched_at
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+class ResponseCache:
+    """Cache responses under `directory`. `ttl` is in seconds; None never expires an entry."""
+
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'bodies'), exist_ok=True)
+
+    def _entry_path(self, url):
+        key = _sha256(url.encode('utf-8'))
+        return os.path.join(self.directory, 'entries', key[:2], key + '.json')
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, 'bodies', digest[:2], digest + '.gz')
+
+    def _read_meta(self, url):
+        try:
+            with open(self._entry_path(url), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, url, meta):
+        path = self._entry_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, json.dumps(meta).encode('utf-8'))
+
+    def get(self, url):
+        meta = self._read_meta(url)
+        if meta is None:
+            return None
+        try:
+            with gzip.open(self._body_path(meta['body']), 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, EOFError, OSError):
+            return None
+        headers = http.client.parse_headers(io.BytesIO(meta['headers'].encode('iso-8859-1')))
+        return CacheEntry(meta['url'], meta['status'], headers, body, meta['fetched_at'])
+
+    def is_fresh(self, entry):
+        return self.ttl is None or entry.age() < self.ttl
+
+    def validators(self, entry):
+        """Conditional request headers that let the server answer 304 Not Modified."""
+        headers = {}
+        if entry.headers.get('ETag'):
+            headers['If-None-Match'] = entry.headers['ETag']
+        if entry.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = entry.headers['Last-Modified']
+        return headers
+
+    def put(self, url, response):
+        digest = _sha256(response.body)
+        body_path = self._body_path(digest)
+        if not os.path.exists(body_path):
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            _write_atomic(body_path, gzip.compress(response.body))
+
+        headers = ''.join(f'{name}: {value}\r\n' for name, value in response.headers.items()
+                          if name.lower() not in WIRE_HEADERS)
+        self._write_meta(url, {'url': response.url,
+                               'status': response.status,
+                               'headers': headers,
+                               'body': digest,
+                               'fetched_at': time.time()})
+
+    def touch(self, url):
+        # the server confirmed the cached copy is still current
+        meta = self._read_meta(url)
+        if meta is not None:
+            meta['fetched_at'] = time.time()
+            self._write_meta(url, meta)
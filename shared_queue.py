@@ -0,0 +1,135 @@
+"""
+A job queue shared by every get_books process on one machine working on the same output directory.
+
+- jobs.sqlite in the output directory holds one row per book: queued, leased, done or dead
+- a process claims a book by taking a lease on it, in one transaction, so no two processes
+  ever fetch the same book, and renews the leases it holds while it works on them
+- a process that dies stops renewing: once its leases expire, their books are claimed by the
+  processes still running
+- any number of processes can be started or stopped at any time; each one runs until no book is
+  left queued or leased
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+JOBS_FILE = 'jobs.sqlite'
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+DEAD = 'dead'
+
+
+class SharedQueue:
+    def __init__(self, path, lease_seconds=60, started_at=None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        # books finished before this process started may be queued again, those finished since may not:
+        # another process got to them between this process reading the manifest and adding them, so
+        # `started_at` is when the manifest was read (default: now)
+        self.started_at = started_at or time.time()
+        # one connection shared by the worker threads, serialised by the lock; other processes wait on SQLite's own lock
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                     item        TEXT PRIMARY KEY,
+                                     state       TEXT NOT NULL,
+                                     owner       TEXT,
+                                     lease_until REAL,
+                                     claims      INTEGER NOT NULL DEFAULT 0,
+                                     finished_at REAL)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT, lease_until REAL)')
+
+        self.stopped = threading.Event()
+        self.renewer = threading.Thread(target=self._renew_leases, daemon=True)
+        self.renewer.start()
+
+    @classmethod
+    def open(cls, output_directory_path, lease_seconds=60, started_at=None):
+        return cls(os.path.join(output_directory_path, JOBS_FILE), lease_seconds, started_at)
+
+    def add(self, items):
+        """Queue items that are not queued, leased or finished by another process already."""
+        with self.lock:
+            self.conn.executemany('''INSERT INTO jobs (item, state) VALUES (?, ?)
+                                     ON CONFLICT (item) DO UPDATE SET state = excluded.state, owner = NULL, lease_until = NULL
+                                     WHERE state IN (?, ?) AND finished_at < ?''',
+                                  [(item, QUEUED, DONE, DEAD, self.started_at) for item in items])
+
+    def claim(self):
+        """Lease the next queued item, or one whose lease has expired, and return it; None if there is none."""
+        now = time.time()
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't select the same row
+            self.conn.execute('BEGIN IMMEDIATE')
+            row = self.conn.execute('''SELECT item FROM jobs WHERE state = ? OR (state = ? AND lease_until < ?)
+                                       ORDER BY rowid LIMIT 1''', (QUEUED, LEASED, now)).fetchone()
+            if row:
+                self.conn.execute('UPDATE jobs SET state = ?, owner = ?, lease_until = ?, claims = claims + 1 WHERE item = ?',
+                                  (LEASED, self.owner, now + self.lease_seconds, row['item']))
+            self.conn.execute('COMMIT')
+        return row['item'] if row else None
+
+    def _finish(self, item, state):
+        with self.lock:
+            self.conn.execute('''UPDATE jobs SET state = ?, owner = NULL, lease_until = NULL, finished_at = ?
+                                 WHERE item = ? AND owner = ?''', (state, time.time(), item, self.owner))
+
+    def done(self, item):
+        self._finish(item, DONE)
+
+    def dead(self, item):
+        self._finish(item, DEAD)
+
+    def unfinished(self):
+        """How many items are queued or leased, by any process."""
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)', (QUEUED, LEASED)).fetchone()[0]
+
+    def _renew_leases(self):
+        # an item waiting out a retry backoff is still held, so leases are renewed whatever the workers do
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                until = time.time() + self.lease_seconds
+                self.conn.execute('UPDATE jobs SET lease_until = ? WHERE state = ? AND owner = ?', (until, LEASED, self.owner))
+                self.conn.execute('UPDATE locks SET lease_until = ? WHERE owner = ?', (until, self.owner))
+
+    @contextmanager
+    def holding(self, name, poll=0.5):
+        """A lock shared with the other processes, e.g. to write the aggregate files one process at a time."""
+        while True:
+            now = time.time()
+            with self.lock:
+                self.conn.execute('INSERT OR IGNORE INTO locks (name) VALUES (?)', (name,))
+                acquired = self.conn.execute('''UPDATE locks SET owner = ?, lease_until = ?
+                                                WHERE name = ? AND (owner IS NULL OR lease_until < ?)''',
+                                             (self.owner, now + self.lease_seconds, name, now)).rowcount
+            if acquired:
+                break
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.conn.execute('UPDATE locks SET owner = NULL, lease_until = NULL WHERE name = ? AND owner = ?',
+                                  (name, self.owner))
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def close(self):
+        self.stopped.set()
+        self.renewer.join()
+        self.conn.close()
@@ -0,0 +1,166 @@
+"""
+History of the statistics of every book get_books scrapes, which the metadata files don't keep
+since every scrape overwrites them.
+
+- only the fields that change between scrapes are tracked (SNAPSHOT_FIELDS): num_ratings,
+  num_reviews, average_rating, rating_distribution and shelves
+- each scrape adds a delta to snapshots.sqlite in the output directory: the fields (or the
+  rating_distribution and shelves entries) that changed since the book's previous snapshot, which
+  is usually a handful of numbers, or nothing at all
+- every KEYFRAME_EVERY snapshots the whole state is stored again as a base, so reading a book as of
+  a date replays at most that many deltas from the last base before it, however long the history
+- fields missing from a scrape (--fields) are not observed rather than removed
+- num_ratings and num_reviews are stored as ints and average_rating as a float, so the history can
+  be summed and plotted as it is; a count the page didn't have is stored as null
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from book_ids import canonical_id
+from book_numbers import to_float, to_int
+
+
+SNAPSHOTS_FILE = 'snapshots.sqlite'
+
+SNAPSHOT_FIELDS = ['num_ratings', 'num_reviews', 'average_rating', 'rating_distribution', 'shelves']
+# scraped as text ('3,456,789', '4.28'), stored as numbers
+NUMBER_FIELDS = {'num_ratings': to_int, 'num_reviews': to_int, 'average_rating': to_float}
+KEYFRAME_EVERY = 50
+
+BASE = 'base'
+DELTA = 'delta'
+
+
+def diff(old, new):
+    """The changes from state `old` to state `new`, as [path, value] to set and [path] to delete."""
+    changes = []
+    for field, value in new.items():
+        previous = old.get(field)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            changes += [[[field, key], count] for key, count in value.items() if previous.get(key) != count]
+            changes += [[[field, key]] for key in previous if key not in value]
+        elif field not in old or previous != value:
+            changes.append([[field], value])
+    return changes
+
+
+def apply(state, changes):
+    for change in changes:
+        path = change[0]
+        target = state
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        if len(change) == 1:
+            target.pop(path[-1], None)
+        else:
+            target[path[-1]] = change[1]
+    return state
+
+
+def observe(book, fields):
+    """The tracked fields of a scraped book, with its counts and average rating as numbers."""
+    return {field: NUMBER_FIELDS[field](book[field]) if field in NUMBER_FIELDS else book[field]
+            for field in fields if field in book}
+
+
+def _encode(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class SnapshotStore:
+    def __init__(self, path, fields=SNAPSHOT_FIELDS):
+        self.path = path
+        self.fields = fields
+        # one connection shared by the worker threads, serialised by the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            # WITHOUT ROWID: the snapshots of a book are stored together, in time order
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS snapshots (
+                                     canonical_id TEXT NOT NULL,
+                                     taken_at     TEXT NOT NULL,
+                                     kind         TEXT NOT NULL,
+                                     data         TEXT NOT NULL,
+                                     PRIMARY KEY (canonical_id, taken_at)) WITHOUT ROWID''')
+
+    @classmethod
+    def open(cls, output_directory_path):
+        return cls(os.path.join(output_directory_path, SNAPSHOTS_FILE))
+
+    def _state(self, book, when=None):
+        """(state of a book as of `when` or now, number of snapshots since its last base); caller holds the lock."""
+        when = when or '9999'
+        base = self.conn.execute('''SELECT taken_at, data FROM snapshots WHERE canonical_id = ? AND kind = ? AND taken_at <= ?
+                                    ORDER BY taken_at DESC LIMIT 1''', (book, BASE, when)).fetchone()
+        if base is None:
+            return None, 0
+        state = json.loads(base[1])
+        deltas = self.conn.execute('''SELECT data FROM snapshots WHERE canonical_id = ? AND taken_at > ? AND taken_at <= ?
+                                      ORDER BY taken_at''', (book, base[0], when)).fetchall()
+        for (delta,) in deltas:
+            apply(state, json.loads(delta))
+        return state, len(deltas) + 1
+
+    def add(self, book_id, book, taken_at=None):
+        """Record the tracked fields of a book scraped at `taken_at` (now); returns the number of fields changed."""
+        taken_at = (taken_at or datetime.now()).isoformat()
+        observed = observe(book, self.fields)
+        book = canonical_id(book_id)
+        with self.lock:
+            state, since_base = self._state(book)
+            changes = diff(state or {}, observed)
+            if state is None or since_base >= KEYFRAME_EVERY:
+                kind, data = BASE, apply(state or {}, changes)
+            else:
+                kind, data = DELTA, changes
+            self.conn.execute('INSERT OR REPLACE INTO snapshots (canonical_id, taken_at, kind, data) VALUES (?, ?, ?, ?)',
+                              (book, taken_at, kind, _encode(data)))
+        return len(changes)
+
+    def as_of(self, book_id, when):
+        """The tracked fields of a book as they were at datetime `when`, None if it wasn't scraped by then."""
+        with self.lock:
+            return self._state(canonical_id(book_id), when.isoformat())[0]
+
+    def series(self, book_id, field, since=None, until=None):
+        """[(datetime, value)] of a field at every snapshot of a book, e.g. 'num_ratings' or 'shelves.to-read'.
+
+        The value is None at the snapshots before the field was first observed.
+        """
+        path = field.split('.', 1)
+        with self.lock:
+            rows = self.conn.execute('''SELECT taken_at, data FROM snapshots WHERE canonical_id = ? AND taken_at <= ?
+                                        ORDER BY taken_at''', (canonical_id(book_id), until.isoformat() if until else '9999')).fetchall()
+        state = {}
+        points = []
+        for taken_at, data in rows:
+            # bases restate everything, so one delta step replays either kind
+            data = json.loads(data)
+            state = apply(state, data) if isinstance(data, list) else data
+            if since and taken_at < since.isoformat():
+                continue
+            value = state.get(path[0])
+            if len(path) > 1:
+                value = value.get(path[1]) if isinstance(value, dict) else None
+            points.append((datetime.fromisoformat(taken_at), value))
+        return points
+
+    def copy_from(self, path):
+        """Add the snapshots of another snapshots.sqlite (merge_shards.py) that this one doesn't have."""
+        with self.lock:
+            self.conn.execute('ATTACH DATABASE ? AS other', (path,))
+            try:
+                return self.conn.execute('INSERT OR IGNORE INTO snapshots SELECT * FROM other.snapshots').rowcount
+            finally:
+                self.conn.execute('DETACH DATABASE other')
+
+    def books(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT DISTINCT canonical_id FROM snapshots ORDER BY canonical_id')]
+
+    def close(self):
+        self.conn.close()
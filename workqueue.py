@@ -0,0 +1,122 @@
+"""
+A retrying work queue: runs a function over items on a pool of threads.
+
+- an item that raises a retryable error goes back on the queue with exponential backoff
+  (or after the delay the server asked for in Retry-After), without blocking a worker meanwhile
+- an item that keeps failing, or fails with a permanent error, is handed to the dead-letter
+  callback and the rest of the run carries on
+- with a SharedQueue (shared_queue.py), the items are claimed from it rather than kept in this
+  process, so several processes can work through the same items
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class WorkQueue:
+    def __init__(self, func, workers=4, max_attempts=5, base_delay=2.0, max_delay=300.0,
+                 is_retryable=None, retry_after=None, shared=None, poll=1.0):
+        self.func = func
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_retryable = is_retryable or (lambda error: True)
+        self.retry_after = retry_after or (lambda error: None)
+        self.shared = shared
+        self.poll = poll  # how often to look for items added to, or released in, the shared queue
+
+        self.pending = []  # heap of (ready_at, seq, item, attempt)
+        self.seq = itertools.count()
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def backoff(self, error, attempt):
+        """Seconds to wait before the next attempt of an item that failed `attempt` times."""
+        delay = self.retry_after(error)
+        if delay is None:
+            # exponential backoff with jitter, so items that failed together don't retry together
+            delay = self.base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        return min(delay, self.max_delay)
+
+    def put(self, item, attempt=1, delay=0.0):
+        if self.shared and attempt == 1:
+            # new items go to the shared queue, for any process to claim; retries stay with the process holding them
+            self.shared.add([item])
+            with self.condition:
+                self.condition.notify()
+            return
+        with self.condition:
+            heapq.heappush(self.pending, (time.monotonic() + delay, next(self.seq), item, attempt))
+            self.condition.notify()
+
+    def _next(self):
+        with self.condition:
+            while True:
+                wait = self.pending[0][0] - time.monotonic() if self.pending else None
+                if wait is not None and wait <= 0:
+                    _, _, item, attempt = heapq.heappop(self.pending)
+                    self.in_flight += 1
+                    return item, attempt
+                if self.shared:
+                    item = self.shared.claim()
+                    if item is not None:
+                        self.in_flight += 1
+                        return item, 1
+                    # items leased by a process that died come back once their lease expires
+                    wait = min(wait or self.poll, self.poll)
+                    if not self.pending and self.in_flight == 0 and not self.shared.unfinished():
+                        return None
+                elif not self.pending and self.in_flight == 0:
+                    return None  # nothing queued and nothing running that could requeue
+                self.condition.wait(wait)
+
+    def _work(self, on_success, on_retry, on_dead):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            item, attempt = task
+            try:
+                result = self.func(item)
+            except Exception as error:
+                if attempt < self.max_attempts and self.is_retryable(error):
+                    delay = self.backoff(error, attempt)
+                    if on_retry:
+                        on_retry(item, error, attempt, delay)
+                    self.put(item, attempt + 1, delay)
+                else:
+                    if self.shared:
+                        self.shared.dead(item)
+                    if on_dead:
+                        on_dead(item, error, attempt)
+            else:
+                if self.shared:
+                    self.shared.done(item)
+                if on_success:
+                    on_success(item, result)
+            finally:
+                with self.condition:
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+
+    def run(self, items, on_success=None, on_retry=None, on_dead=None):
+        """Process every item and return once each has succeeded or gone to the dead letters.
+
+        on_success(item, result), on_retry(item, error, attempt, delay) and on_dead(item, error, attempts)
+        are called from the worker threads.
+        """
+        if self.shared:
+            self.shared.add(items)
+        else:
+            for item in items:
+                self.put(item)
+
+        threads = [threading.Thread(target=self._work, args=(on_success, on_retry, on_dead), daemon=True)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()